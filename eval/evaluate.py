@@ -1,9 +1,15 @@
 import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 import numpy as np
 
 
-API_URL = "http://localhost:8000/search"
+BATCH_API_URL = "http://localhost:8000/search_batch"
+# queries per /search_batch request, and requests in flight, in "http" mode
+HTTP_BATCH = 32
+HTTP_CONCURRENCY = 4
 
 # =====================================================
 # Utility: MRR
@@ -16,98 +22,135 @@ def compute_mrr(all_ranks):
 
 
 # =====================================================
-# Utility: NDCG@K
+# Vectorized metrics over all queries at once
 # =====================================================
-def compute_ndcg(results, k):
-    """results = [1,0,0...] relevance for retrieved docs"""
-    dcg = 0
-    for rank, rel in enumerate(results[:k], start=1):
-        if rel == 1:
-            dcg += 1 / np.log2(rank + 1)
+def score_rankings(retrieved, expected, top_k):
+    """
+    retrieved: list of ranked filename lists, expected: list of filenames.
+    Returns (hit, rank, ndcg) arrays with one entry per query; rank is 0
+    for a miss and ndcg is nDCG@top_k with the expected file as the one
+    relevant document.
+    """
+    names = np.full((len(retrieved), top_k), "", dtype=object)
+    for i, r in enumerate(retrieved):
+        names[i, :len(r[:top_k])] = r[:top_k]
+    relevance = names == np.asarray(expected, dtype=object)[:, None]
 
-    idcg = 1 / np.log2(1 + 1)  # ideal rank = 1
-    return dcg / idcg if idcg != 0 else 0
+    hit = relevance.any(axis=1)
+    rank = np.where(hit, relevance.argmax(axis=1) + 1, 0)
+    discounts = 1.0 / np.log2(np.arange(2, top_k + 2))
+    ndcg = (relevance * discounts).sum(axis=1)  # ideal DCG is 1 (single relevant doc at rank 1)
+    return hit, rank, ndcg
+
+
+# =====================================================
+# Retrieval backends: ranked filenames per query
+# =====================================================
+def retrieve_http(queries, top_k, batch_size=HTTP_BATCH, concurrency=HTTP_CONCURRENCY):
+    """Retrieval-only /search_batch calls (no explanations, no full text), several in flight."""
+    session = requests.Session()
+
+    def fetch(batch):
+        resp = session.post(BATCH_API_URL, json={
+            "queries": batch,
+            "top_k": top_k,
+            "explain": False,
+            "include_full_text": False,
+        })
+        if resp.status_code != 200 or "results" not in resp.json():
+            return [None] * len(batch)
+        return [[r["filename"] for r in q["results"]] for q in resp.json()["results"]]
+
+    batches = [queries[i:i + batch_size] for i in range(0, len(queries), batch_size)]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return [r for rows in pool.map(fetch, batches) for r in rows]
+
+
+def retrieve_offline(queries, top_k):
+    """
+    Drive the embedder and the persisted FAISS index in-process: all
+    queries embedded in one batch, searched in one call. Run from the
+    directory holding faiss_index.bin / faiss_meta.pkl.
+    """
+    from src.embed_service.embedder import Embedder
+    from src.common.text import normalize_query
+    from src.search_service.indexer import FAISSIndexer
+
+    indexer = FAISSIndexer()
+    indexer.try_load()
+    if indexer.index is None:
+        raise RuntimeError("no FAISS index found; run /initialize first")
+
+    embeddings = Embedder().embed_batch([normalize_query(q) for q in queries])
+    hits = indexer.search_documents_batch(embeddings, top_k)
+    return [[h["filename"] for h in doc_hits] for doc_hits in hits]
 
 
 # =====================================================
 # MAIN EVALUATION FUNCTION
 # =====================================================
-def run_evaluation(query_file="generated_queries.json", top_k=10):
+def run_evaluation(query_file="generated_queries.json", top_k=10, mode="http"):
     """
     top_k is FIXED = 10 for a realistic evaluation.
+    mode="http" evaluates the running gateway (retrieval only, concurrent
+    batches); mode="offline" needs no services, only the saved index.
     """
 
     with open(query_file) as f:
         queries = json.load(f)
 
-    correct = []
-    ranks = []
-    ndcg_scores = []
-    detailed = []
-
-    for item in queries:
-        query = item["query"]
-        expected = item["doc_id"] + ".txt"
-
-        # ----------------------------
-        # CALL API
-        # ----------------------------
-        resp = requests.post(API_URL, json={"query": query, "top_k": top_k})
-        if resp.status_code != 200:
-            continue
-
-        results = resp.json().get("results", [])
-        retrieved = [r["filename"] for r in results]
-
-        # relevance array for NDCG
-        relevance = [1 if fn == expected else 0 for fn in retrieved]
-
-        # ----------------------------
-        # ACCURACY
-        # ----------------------------
-        hit = expected in retrieved
-        correct.append(1 if hit else 0)
-
-        # ----------------------------
-        # RANK for MRR
-        # ----------------------------
-        if hit:
-            rank_position = retrieved.index(expected) + 1
-            ranks.append(rank_position)
-        else:
-            rank_position = None
-
-        # ----------------------------
-        # NDCG
-        # ----------------------------
-        ndcg_scores.append(compute_ndcg(relevance, top_k))
-
-        # ----------------------------
-        # Save detail
-        # ----------------------------
-        detailed.append({
-            "query": query,
-            "expected": expected,
-            "retrieved": retrieved,
-            "rank": rank_position,
-            "is_correct": hit
-        })
+    texts = [item["query"] for item in queries]
+    if mode == "offline":
+        retrieved = retrieve_offline(texts, top_k)
+    elif mode == "http":
+        retrieved = retrieve_http(texts, top_k)
+    else:
+        raise ValueError(f"unknown evaluation mode {mode!r}")
+
+    # queries whose request failed are skipped, as before
+    answered = [i for i, r in enumerate(retrieved) if r is not None]
+    expected = [queries[i]["doc_id"] + ".txt" for i in answered]
+    hit, rank, ndcg = score_rankings([retrieved[i] for i in answered], expected, top_k)
+
+    detailed = [
+        {
+            "query": texts[i],
+            "expected": exp,
+            "retrieved": retrieved[i],
+            "rank": int(r) if h else None,
+            "is_correct": bool(h),
+        }
+        for i, exp, h, r in zip(answered, expected, hit, rank)
+    ]
 
     # =====================================================
     # FINAL METRICS
     # =====================================================
-    accuracy = round(np.mean(correct) * 100, 2)
-    mrr = round(compute_mrr(ranks), 4)
-    mean_ndcg = round(float(np.mean(ndcg_scores)), 4)
+    correct = int(hit.sum())
+    accuracy = round(float(hit.mean()) * 100, 2) if len(hit) else 0.0
+    mrr = round(compute_mrr(rank[hit].tolist()), 4)
+    mean_ndcg = round(float(ndcg.mean()), 4) if len(ndcg) else 0.0
 
     summary = {
         "accuracy": accuracy,
         "mrr": mrr,
         "ndcg": mean_ndcg,
         "total_queries": len(queries),
-        "correct_count": sum(correct),
-        "incorrect_count": len(queries) - sum(correct),
+        "correct_count": correct,
+        "incorrect_count": len(queries) - correct,
         "details": detailed
     }
 
     return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrieval accuracy / MRR / nDCG over generated queries")
+    parser.add_argument("--queries", default="generated_queries.json")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--mode", choices=["http", "offline"], default="http")
+    args = parser.parse_args()
+
+    summary = run_evaluation(args.queries, top_k=args.top_k, mode=args.mode)
+    summary.pop("details")
+    print(json.dumps(summary, indent=2))
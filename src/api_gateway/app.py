@@ -1,86 +1,502 @@
 # src/api_gateway/app.py
-from fastapi import FastAPI
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+import httpx
+import numpy as np
+from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import requests
-import time
-app = FastAPI(title="API Gateway")
+from src.common import metrics, wire
 
 DOC_URL = "http://localhost:9001"
 EMBED_URL = "http://localhost:9002"
 SEARCH_URL = "http://localhost:9003"
 EXPLAIN_URL = "http://localhost:9004"
-import os
 DATA_FOLDER = os.environ.get("DATA_FOLDER", "/app/docs")
+# documents per /load_docs page, and per chunk/embed/sentence round trip during /initialize
+LOAD_PAGE = int(os.environ.get("INIT_LOAD_PAGE", "1000"))
+INIT_BATCH = int(os.environ.get("INIT_BATCH", "256"))
+# max number of per-result explain calls in flight for one /search_stream request
+GATEWAY_CONCURRENCY = int(os.environ.get("GATEWAY_CONCURRENCY", "8"))
+# "services": doc/embed/search/explain are separate HTTP services (start.sh starts all five);
+# "monolith": they run inside this process behind the same client interface, sharing one model
+DEPLOY_MODE = os.environ.get("DEPLOY_MODE", "services")
+
+if DEPLOY_MODE == "monolith":
+    from src.api_gateway.local_client import LocalClient
+    from src.doc_service import app as doc_service
+    from src.embed_service import app as embed_service
+    from src.search_service import app as search_service
+    from src.explain_service import app as explain_service
+
+    # numpy arrays are handed between components as-is
+    EMBEDDING_FORMAT = wire.IN_PROCESS
+    doc_client = LocalClient(doc_service.app)
+    embed_client = LocalClient(embed_service.app, headers={wire.FORMAT_HEADER: EMBEDDING_FORMAT})
+    search_client = LocalClient(search_service.app)
+    explain_client = LocalClient(explain_service.app)
+else:
+    # how embeddings travel between services: "base64" (packed float32) or "json" (lists of floats)
+    EMBEDDING_FORMAT = os.environ.get("GATEWAY_EMBEDDING_FORMAT", wire.BINARY)
+
+    # one keep-alive connection pool per downstream service; every call carries the request id
+    _POOL_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+    _HOOKS = {"request": [metrics.propagate_request_id]}
+    doc_client = httpx.AsyncClient(base_url=DOC_URL, limits=_POOL_LIMITS, event_hooks=_HOOKS)
+    embed_client = httpx.AsyncClient(
+        base_url=EMBED_URL, limits=_POOL_LIMITS, event_hooks=_HOOKS, headers={wire.FORMAT_HEADER: EMBEDDING_FORMAT},
+    )
+    search_client = httpx.AsyncClient(base_url=SEARCH_URL, limits=_POOL_LIMITS, event_hooks=_HOOKS)
+    explain_client = httpx.AsyncClient(base_url=EXPLAIN_URL, limits=_POOL_LIMITS, event_hooks=_HOOKS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    for client in (doc_client, embed_client, search_client, explain_client):
+        await client.aclose()
+
+
+app = metrics.instrument(FastAPI(title="API Gateway", lifespan=lifespan), "gateway")
 
 class SearchQuery(BaseModel):
     query: str
     top_k: int = 5
+    # skip shipping original_text from doc_service when the caller does not render it
+    include_full_text: bool = True
+    # ANN search-time knobs passed through to the search service (IVF / HNSW indexes)
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    # how passage hits are pooled into a document score: "max" (best passage) or "sum"
+    pooling: str = "max"
+    # add {"request_id", "timings": {stage: ms}} to the response
+    timings: bool = False
 
-@app.post("/initialize")
-def initialize():
-    # 1) load docs
-    d = requests.post(f"{DOC_URL}/load_docs", json={"folder": DATA_FOLDER}, timeout=20)
-    if d.status_code != 200:
-        return {"error": "doc_load_failed", "detail": d.text}
-    docs = d.json().get("documents", [])
-
-    # 2) prepare docs for embed_batch: ensure keys filename,text,hash
-    batch_docs = [{"filename": x["filename"], "text": x.get("clean_text", x.get("text","")), "hash": x["hash"]} for x in docs]
+def _trace():
+    return {"request_id": metrics.request_id(), "timings": metrics.current_timings()}
 
-    # 3) embed batch
-    e = requests.post(f"{EMBED_URL}/embed_batch", json={"docs": batch_docs}, timeout=60)
+async def _embed_docs(batch_docs: list):
+    """Returns (error, float32 matrix) with row i embedding batch_docs[i]."""
+    e = await embed_client.post("/embed_batch", json={"docs": batch_docs}, timeout=60)
     if e.status_code != 200:
-        return {"error": "embed_failed", "detail": e.text}
-    embed_out = e.json()
-    embeddings = [r["embedding"] for r in embed_out["results"]]
-    meta = {i: r["filename"] for i, r in enumerate(embed_out["results"])}
+        return {"error": "embed_failed", "detail": e.text}, None
+    data = e.json()
+    if "embeddings" in data:
+        matrix = wire.decode_matrix(data["embeddings"])
+    else:
+        matrix = wire.decode_matrix([r["embedding"] for r in data["results"]])
+    # rows are matched to the request by the filename each result carries, never by position,
+    # so a vector can only be stored with the hash of the document it was computed for
+    row_of = {r["filename"]: i for i, r in enumerate(data["results"])}
+    missing = [d["filename"] for d in batch_docs if d["filename"] not in row_of]
+    if missing:
+        return {"error": "embed_failed", "detail": f"no embedding returned for {missing[:5]}"}, None
+    return None, matrix[[row_of[d["filename"]] for d in batch_docs]]
+
+async def _ingest(batch_docs: list):
+    """
+    For each batch of INIT_BATCH documents: fetch the text and its passages
+    from doc_service, embed every passage, and precompute sentence
+    embeddings in the explain service. Returns (error, chunks, embeddings,
+    sentences) where chunks[i] describes the passage behind embeddings[i].
+    """
+    chunks, embedded = [], []
+    sentences = {"count": 0, "indexed": 0, "cached": 0}
+    for start in range(0, len(batch_docs), INIT_BATCH):
+        part = batch_docs[start:start + INIT_BATCH]
+        c = await doc_client.post(
+            "/get_docs",
+            json={"filenames": [d["filename"] for d in part], "fields": ["hash", "clean_text", "chunks"]},
+            timeout=60,
+        )
+        if c.status_code != 200:
+            return {"error": "chunking_failed", "detail": c.text}, [], None, sentences
+        docs = c.json()["documents"]
+
+        part_chunks = []
+        for doc in docs:
+            for chunk in doc["chunks"]:
+                part_chunks.append({
+                    # passages are cached under filename::n, keyed by their own content hash
+                    "key": f"{doc['filename']}::{chunk['chunk']}",
+                    "text": chunk["text"],
+                    "hash": chunk["hash"],
+                    "filename": doc["filename"],
+                    "doc_hash": doc["hash"],
+                    "offset": chunk["offset"],
+                })
+        if part_chunks:
+            error, part_embedded = await _embed_docs([{"filename": c["key"], "text": c["text"], "hash": c["hash"]} for c in part_chunks])
+            if error:
+                return error, [], None, sentences
+            for c in part_chunks:
+                del c["text"]
+            chunks.extend(part_chunks)
+            embedded.append(part_embedded)
+
+        # precompute sentence splits + embeddings so explanations are a dot product at query time
+        x = await explain_client.post(
+            "/index_sentences",
+            json={"docs": [{"hash": doc["hash"], "text": doc["clean_text"]} for doc in docs]},
+            timeout=120,
+        )
+        if x.status_code == 200:
+            for k, v in x.json().items():
+                sentences[k] += v
+        else:
+            sentences["error"] = x.text
+
+    embeddings = np.concatenate(embedded) if embedded else np.zeros((0, 0), dtype="float32")
+    return None, chunks, embeddings, sentences
 
-    # 4) build index
-    b = requests.post(f"{SEARCH_URL}/build_index", json={"embeddings": embeddings, "meta": meta}, timeout=60)
+async def _release_passages(prefixes: list):
+    """Unlink cached passage names; _ingest re-links the ones that still exist, /compact drops the rest."""
+    await embed_client.post("/release", json={"prefixes": prefixes}, timeout=60)
+
+async def _rebuild_index(batch_docs: list):
+    """Embed every document's passages and build the index from scratch."""
+    await _release_passages([""])
+    error, chunks, embeddings, sentences = await _ingest(batch_docs)
+    if error:
+        return error
+    meta = {i: c["filename"] for i, c in enumerate(chunks)}
+    hashes = {d["filename"]: d["hash"] for d in batch_docs}
+
+    b = await search_client.post("/build_index", json={
+        "embeddings": wire.pack(embeddings, EMBEDDING_FORMAT),
+        "meta": meta,
+        "hashes": hashes,
+        "offsets": [c["offset"] for c in chunks],
+    }, timeout=60)
     if b.status_code != 200:
         return {"error": "build_index_failed", "detail": b.text}
+    return {"mode": "rebuild", "embeddings": len(embeddings), "build": b.json(), "sentences": sentences}
 
-    return {"docs_loaded": len(docs), "embeddings": len(embeddings), "build": b.json()}
+async def _update_index(batch_docs: list, indexed_hashes: dict):
+    """
+    Send only documents whose hash differs from the indexed one, and delete
+    documents that disappeared. Returns None when the search service asks
+    for a full rebuild instead.
+    """
+    current = {d["filename"] for d in batch_docs}
+    changed = [d for d in batch_docs if indexed_hashes.get(d["filename"]) != d["hash"]]
+    removed = [f for f in indexed_hashes if f not in current]
 
-@app.post("/search")
-def search(req: SearchQuery):
-    # embed query
-    unique_id = str(time.time())
-    q = requests.post(f"{EMBED_URL}/embed_document", json={"filename": f"query_{unique_id}", "text": req.query, "hash": unique_id},   timeout=10)
+    upserted = {"updated": 0, "added": 0, "vectors": 0}
+    sentences = {"count": 0, "indexed": 0, "cached": 0}
+    if changed or removed:
+        await _release_passages([f"{f}::" for f in [d["filename"] for d in changed] + removed])
+    if changed:
+        error, chunks, embeddings, sentences = await _ingest(changed)
+        if error:
+            return error
+        u = await search_client.post("/upsert_vectors", json={
+            "embeddings": wire.pack(embeddings, EMBEDDING_FORMAT),
+            "filenames": [c["filename"] for c in chunks],
+            "hashes": [c["doc_hash"] for c in chunks],
+            "offsets": [c["offset"] for c in chunks],
+        }, timeout=60)
+        if u.status_code != 200:
+            return {"error": "upsert_failed", "detail": u.text}
+        upserted = u.json()
+        if "error" in upserted:
+            return None
+
+    deleted = {"deleted": 0}
+    if removed:
+        r = await search_client.post("/delete_vectors", json={"filenames": removed}, timeout=60)
+        if r.status_code != 200:
+            return {"error": "delete_failed", "detail": r.text}
+        deleted = r.json()
+        if "error" in deleted:
+            return None
+
+    return {"mode": "incremental", "embeddings": upserted["vectors"], **upserted, **deleted, "sentences": sentences}
+
+async def _load_page(offset: int):
+    """One page of doc_service's scan of DATA_FOLDER (offset 0 rescans); returns (error, page)."""
+    d = await doc_client.post("/load_docs", json={"folder": DATA_FOLDER, "offset": offset, "limit": LOAD_PAGE}, timeout=600)
+    if d.status_code != 200:
+        return {"error": "doc_load_failed", "detail": d.text}, None
+    page = d.json()
+    if "error" in page:
+        return {"error": "doc_load_failed", "detail": page["error"]}, None
+    return None, page
+
+async def _list_docs(page: dict):
+    """Page through the rest of the scan from its first page; returns (error, [{filename, hash}])."""
+    docs = []
+    while True:
+        docs.extend({"filename": x["filename"], "hash": x["hash"]} for x in page["documents"])
+        if page["next_offset"] is None:
+            return None, docs
+        error, page = await _load_page(page["next_offset"])
+        if error:
+            return error, []
+
+@app.post("/initialize")
+async def initialize():
+    # 1) scan (unchanged files are not even read by doc_service); the first page carries the corpus fingerprint
+    error, first_page = await _load_page(0)
+    if error:
+        return error
+
+    # 2) nothing to do when the index was built from exactly this corpus
+    st = await search_client.get("/index_state", params={"include_hashes": False}, timeout=10)
+    state = st.json() if st.status_code == 200 else {"built": False}
+    incremental = state["built"] and state["incremental"] and state["chunked"]
+    if incremental and state["fingerprint"] == first_page["fingerprint"]:
+        return {"docs_loaded": first_page["count"], "mode": "unchanged", "fingerprint": state["fingerprint"]}
+
+    # 3) list docs (filename + hash only)
+    error, batch_docs = await _list_docs(first_page)
+    if error:
+        return error
+
+    # 4) update the index in place when it tracks vector ids, hashes and chunks, otherwise rebuild it
+    result = None
+    if incremental:
+        st = await search_client.get("/index_state", timeout=10)
+        if st.status_code == 200:
+            result = await _update_index(batch_docs, st.json()["hashes"])
+    if result is None:
+        result = await _rebuild_index(batch_docs)
+    if "error" in result:
+        return result
+
+    # 5) drop cached vectors no live passage points at (once enough of the file is garbage)
+    c = await embed_client.post("/compact", json={}, timeout=600)
+    cache = c.json() if c.status_code == 200 else {"error": "compact_failed", "detail": c.text}
+
+    return {"docs_loaded": len(batch_docs), **result, "cache": cache}
+
+async def _ready(client):
+    try:
+        r = await client.get("/ready", timeout=2)
+    except httpx.HTTPError as e:
+        return {"ready": False, "error": repr(e)}
+    if r.status_code not in (200, 503):  # 503 is a service's own "not ready" answer, with details
+        return {"ready": False, "status_code": r.status_code, "detail": r.text}
+    return r.json()
+
+@app.get("/ready")
+async def ready(response: Response):
+    # ready once every downstream service answers its own /ready (start.sh polls this before /initialize)
+    names = ("doc", "embed", "search", "explain")
+    states = await asyncio.gather(*(_ready(client) for client in (doc_client, embed_client, search_client, explain_client)))
+    services = dict(zip(names, states))
+    all_ready = all(state.get("ready") for state in states)
+    if not all_ready:
+        response.status_code = 503
+    return {"ready": all_ready, "deploy_mode": DEPLOY_MODE, "services": services}
+
+async def _retrieve(req: SearchQuery):
+    """Embed the query, search the index and bulk-fetch the hit documents.
+    Returns (error, hits) where hits is a ranked list of (doc, hit) and hit
+    carries the score and the character offset of the best-matching passage."""
+    # embed query (served from the embed service's query LRU, never persisted)
+    with metrics.stage("embed_query"):
+        q = await embed_client.post("/embed_query", json={"query": req.query}, timeout=10)
     if q.status_code != 200:
-        return {"error": "embed_query_failed", "detail": q.text}
+        return {"error": "embed_query_failed", "detail": q.text}, []
+    # passed through as received (packed or list); search_vectors accepts both
     q_emb = q.json()["embedding"]
 
     # search vectors
-    s = requests.post(f"{SEARCH_URL}/search_vectors", json={"query_embedding": q_emb, "top_k": req.top_k}, timeout=10)
+    with metrics.stage("search_vectors"):
+        s = await search_client.post(
+            "/search_vectors",
+            json={
+                "query_embedding": q_emb,
+                "top_k": req.top_k,
+                "pooling": req.pooling,
+                "nprobe": req.nprobe,
+                "ef_search": req.ef_search,
+            },
+            timeout=10,
+        )
+    if s.status_code != 200:
+        return {"error": "search_failed", "detail": s.text}, []
+    sdata = s.json()
+    if "error" in sdata:
+        return {"error": "search_index_error", "detail": sdata}, []
+
+    hits = _hits_of(sdata)
+    error, docs = await _fetch_docs([h["filename"] for h in hits], req.include_full_text)
+    if error:
+        return error, []
+    return None, [(docs[h["filename"]], h) for h in hits if h["filename"] in docs]
+
+def _hits_of(sdata: dict):
+    # filenames is aligned with scores; None marks an empty slot (fewer hits than top_k)
+    return [
+        {"filename": f, "score": score, "offset": offset}
+        for f, score, offset in zip(sdata["filenames"], sdata["scores"], sdata["offsets"])
+        if f is not None
+    ]
+
+async def _fetch_docs(filenames: list, include_full_text: bool):
+    """One bulk fetch for all hits, projected to the fields we actually use."""
+    fields = ["clean_text", "hash", "original_text"] if include_full_text else ["clean_text", "hash"]
+    with metrics.stage("doc_fetch"):
+        d = await doc_client.post("/get_docs", json={"filenames": filenames, "fields": fields}, timeout=10)
+    if d.status_code != 200:
+        return {"error": "doc_fetch_failed", "detail": d.text}, {}
+    return None, {doc["filename"]: doc for doc in d.json()["documents"]}
+
+def _result_card(doc: dict, hit: dict):
+    # preview starts at the passage that matched best
+    offset = hit["offset"]
+    return {
+        "filename": doc["filename"],
+        "score": float(hit["score"]),
+        "offset": offset,
+        "preview": doc.get("clean_text","")[offset:offset + 350],
+        "full_text": doc.get("original_text",""),
+    }
+
+async def _explain_hits(query: str, hit_docs: list):
+    # explain all hits with one batched call; retrieval results are returned even if explain is down
+    try:
+        with metrics.stage("explain"):
+            exp = await explain_client.post(
+                "/explain_batch",
+                json={
+                    "query": query,
+                    "documents": [doc.get("clean_text","") for doc, _ in hit_docs],
+                    "hashes": [doc.get("hash") for doc, _ in hit_docs],
+                },
+                timeout=30,
+            )
+    except httpx.HTTPError:
+        return [{}] * len(hit_docs)
+    return exp.json()["explanations"] if exp.status_code == 200 else [{}] * len(hit_docs)
+
+@app.post("/search")
+async def search(req: SearchQuery):
+    error, hit_docs = await _retrieve(req)
+    if error:
+        return error
+
+    explanations = await _explain_hits(req.query, hit_docs)
+
+    results = []
+    for (doc, hit), explanation in zip(hit_docs, explanations):
+        results.append({**_result_card(doc, hit), "explanation": explanation})
+    if req.timings:
+        return {"results": results, **_trace()}
+    return {"results": results}
+
+class BatchSearchQuery(BaseModel):
+    queries: List[str]
+    top_k: int = 5
+    # explanations cost an explain round trip per query; ranking-only callers leave this off
+    explain: bool = False
+    include_full_text: bool = False
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    pooling: str = "max"
+    timings: bool = False
+
+@app.post("/search_batch")
+async def search_batch(req: BatchSearchQuery):
+    """
+    Rank documents for many queries at once: one embed call for all
+    queries, one index search over the (N, dim) query matrix and one
+    document fetch for the union of hits. results[i] answers queries[i].
+    """
+    if not req.queries:
+        return {"count": 0, "results": []}
+    with metrics.stage("embed_query"):
+        q = await embed_client.post("/embed_queries", json={"queries": req.queries}, timeout=60)
+    if q.status_code != 200:
+        return {"error": "embed_query_failed", "detail": q.text}
+
+    with metrics.stage("search_vectors"):
+        s = await search_client.post(
+            "/search_vectors_batch",
+            json={
+                "query_embeddings": q.json()["embeddings"],
+                "top_k": req.top_k,
+                "pooling": req.pooling,
+                "nprobe": req.nprobe,
+                "ef_search": req.ef_search,
+            },
+            timeout=60,
+        )
     if s.status_code != 200:
         return {"error": "search_failed", "detail": s.text}
     sdata = s.json()
     if "error" in sdata:
         return {"error": "search_index_error", "detail": sdata}
 
-    scores = sdata["scores"]
-    ids = sdata["ids"]
-    meta = sdata["meta"]  # { "0": filename, ... }
+    per_query = [_hits_of(r) for r in sdata["results"]]
+    filenames = list(dict.fromkeys(h["filename"] for hits in per_query for h in hits))
+    error, docs = await _fetch_docs(filenames, req.include_full_text)
+    if error:
+        return error
+    hit_docs = [[(docs[h["filename"]], h) for h in hits if h["filename"] in docs] for hits in per_query]
+
+    if req.explain:
+        limit = asyncio.Semaphore(GATEWAY_CONCURRENCY)
+
+        async def explain(query, hd):
+            async with limit:
+                return await _explain_hits(query, hd)
+
+        explanations = await asyncio.gather(*(explain(query, hd) for query, hd in zip(req.queries, hit_docs)))
+    else:
+        explanations = [None] * len(hit_docs)
 
-    # for each id load doc from doc service and call explain
     results = []
-    for score, idx in zip(scores, ids):
-        filename = meta.get(str(idx))
-        if filename is None:
-            continue
-        doc_resp = requests.get(f"{DOC_URL}/get_doc/{filename}", timeout=10)
-        if doc_resp.status_code != 200:
-            continue
-        doc = doc_resp.json()  # has clean_text, original_text, ...
-        # explain
-        exp = requests.post(f"{EXPLAIN_URL}/explain", json={"query": req.query, "document_text": doc.get("clean_text","")}, timeout=10)
-        explanation = exp.json() if exp.status_code == 200 else {}
-        results.append({
-            "filename": filename,
-            "score": float(score),
-            "preview": doc.get("clean_text","")[:350],
-            "full_text": doc.get("original_text",""),
-            "explanation": explanation
-        })
-    return {"results": results}
+    for query, hd, exps in zip(req.queries, hit_docs, explanations):
+        cards = [_result_card(doc, hit) for doc, hit in hd]
+        if exps is not None:
+            for card, explanation in zip(cards, exps):
+                card["explanation"] = explanation
+        results.append({"query": query, "results": cards})
+    if req.timings:
+        return {"count": len(results), "results": results, **_trace()}
+    return {"count": len(results), "results": results}
+
+async def _explain_one(query: str, rank: int, doc: dict, limit: asyncio.Semaphore):
+    async with limit:
+        try:
+            with metrics.stage("explain"):
+                exp = await explain_client.post(
+                    "/explain",
+                    json={"query": query, "document_text": doc.get("clean_text",""), "doc_hash": doc.get("hash")},
+                    timeout=30,
+                )
+            explanation = exp.json() if exp.status_code == 200 else {}
+        except httpx.HTTPError:
+            explanation = {}
+    return {"type": "explanation", "rank": rank, "filename": doc["filename"], "explanation": explanation}
+
+@app.post("/search_stream")
+async def search_stream(req: SearchQuery):
+    """
+    NDJSON stream: one {"type": "hits"} line with the ranked results as soon
+    as vector search is done, then one {"type": "explanation", "rank": i}
+    line per result in completion order, then {"type": "done"} (carrying
+    request_id and timings when asked).
+    """
+    async def events():
+        error, hit_docs = await _retrieve(req)
+        if error:
+            yield json.dumps({"type": "error", **error}) + "\n"
+            return
+        results = [_result_card(doc, hit) for doc, hit in hit_docs]
+        yield json.dumps({"type": "hits", "results": results}) + "\n"
+
+        limit = asyncio.Semaphore(GATEWAY_CONCURRENCY)
+        tasks = [_explain_one(req.query, rank, doc, limit) for rank, (doc, _) in enumerate(hit_docs)]
+        for next_done in asyncio.as_completed(tasks):
+            yield json.dumps(await next_done) + "\n"
+        yield json.dumps({"type": "done", **(_trace() if req.timings else {})}) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
@@ -0,0 +1,82 @@
+# src/api_gateway/local_client.py
+import asyncio
+import inspect
+
+from fastapi import Response, params
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+
+
+class LocalResponse:
+    """The part of httpx.Response the gateway reads: status_code, json(), text."""
+
+    def __init__(self, status_code: int, data):
+        self.status_code = status_code
+        self._data = data
+
+    def json(self):
+        return self._data
+
+    @property
+    def text(self):
+        return str(self._data)
+
+
+class LocalClient:
+    """
+    Stand-in for an httpx.AsyncClient that calls the endpoint functions of
+    an in-process FastAPI app directly (monolith deployment).
+
+    Request bodies become the endpoint's pydantic model via model_construct
+    (the gateway is trusted, so nothing is re-validated or serialized) and
+    the returned dict is handed back as-is. Sync endpoints run in a worker
+    thread, as FastAPI would run them. Headers are only used to fill
+    Header() parameters, `params` fill plain query parameters and a
+    Response parameter supplies the status code.
+    """
+
+    def __init__(self, app, headers: dict = None):
+        self.headers = {k.lower(): v for k, v in (headers or {}).items()}
+        self._routes = {}
+        for route in app.routes:
+            if isinstance(route, APIRoute):
+                for method in route.methods:
+                    self._routes[(method, route.path)] = route.endpoint
+
+    def _kwargs(self, endpoint, body, query, response):
+        kwargs = {}
+        for name, param in inspect.signature(endpoint).parameters.items():
+            if isinstance(param.default, params.Header):
+                kwargs[name] = self.headers.get(name.replace("_", "-"))
+            elif param.annotation is Response:
+                kwargs[name] = response
+            elif inspect.isclass(param.annotation) and issubclass(param.annotation, BaseModel):
+                kwargs[name] = param.annotation.model_construct(**(body or {}))
+            elif query and name in query:
+                kwargs[name] = query[name]
+        return kwargs
+
+    async def _call(self, method: str, path: str, body=None, query=None):
+        endpoint = self._routes.get((method, path))
+        if endpoint is None:
+            return LocalResponse(404, {"detail": "Not Found"})
+        response = Response()
+        response.status_code = None
+        try:
+            kwargs = self._kwargs(endpoint, body, query, response)
+            if inspect.iscoroutinefunction(endpoint):
+                data = await endpoint(**kwargs)
+            else:
+                data = await asyncio.to_thread(endpoint, **kwargs)
+        except Exception as e:
+            return LocalResponse(500, {"detail": repr(e)})
+        return LocalResponse(response.status_code or 200, data)
+
+    async def post(self, path: str, json=None, params=None, timeout=None, **kwargs):
+        return await self._call("POST", path, json, params)
+
+    async def get(self, path: str, params=None, timeout=None, **kwargs):
+        return await self._call("GET", path, query=params)
+
+    async def aclose(self):
+        pass
@@ -0,0 +1,239 @@
+# src/bench/benchmark_cache.py
+"""
+Embedding cache benchmark.
+
+Fills a cache backend with synthetic vectors and reports, per size:
+  insert   - bulk add_embeddings throughput and single add_embedding latency
+  startup  - constructing the backend on the filled directory, in a fresh
+             process (page cache is warm, so this is the parse/map cost)
+  lookup   - exists + get_embedding latency for single random filenames,
+             a bulk lookup of --bulk filenames and all_embeddings()
+  memory   - RSS of the fresh process after startup, and bytes on disk
+
+A backend is any class with the CacheManager interface: constructed as
+Backend(cache_dir=...), providing exists, get_embedding, add_embedding,
+add_embeddings and all_embeddings. Pass several --backend module:Class
+to compare them side by side.
+
+    python -m src.bench.benchmark_cache --sizes 10000,100000,1000000 --out cache_bench.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import importlib
+import tempfile
+import traceback
+import multiprocessing
+from queue import Empty
+
+import numpy as np
+
+from src.bench.benchmark_search import percentiles
+
+DEFAULT_BACKEND = "src.embed_service.cache_manager:CacheManager"
+
+
+def load_backend(spec: str):
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def rss_mb():
+    """Current resident set size of this process in MB."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        import resource
+        # peak, not current, where /proc is unavailable (kB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def disk_mb(folder: str):
+    total = 0
+    for root, _, files in os.walk(folder):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total / 2**20
+
+
+def _name(i: int):
+    return f"doc_{i:08d}.txt"
+
+
+def _hash(i: int):
+    return f"{i:032x}"
+
+
+# ---------------------------
+# STAGES
+# ---------------------------
+def fill(cache, size: int, dim: int, batch: int, rng):
+    """Bulk insert `size` vectors in batches; vectors are generated per batch to bound memory."""
+    elapsed = 0.0
+    for start in range(0, size, batch):
+        n = min(batch, size - start)
+        vectors = rng.standard_normal((n, dim), dtype="float32")
+        names = [_name(i) for i in range(start, start + n)]
+        hashes = [_hash(i) for i in range(start, start + n)]
+        t0 = time.perf_counter()
+        cache.add_embeddings(names, hashes, vectors)
+        elapsed += time.perf_counter() - t0
+    return {"vectors": size, "batch": batch, "elapsed_s": elapsed, "vectors_per_s": size / elapsed if elapsed else 0.0}
+
+
+def single_inserts(cache, size: int, dim: int, n: int, rng):
+    samples = []
+    for i in range(size, size + n):
+        vector = rng.standard_normal(dim, dtype="float32")
+        t0 = time.perf_counter()
+        cache.add_embedding(_name(i), _hash(i), vector)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return percentiles(samples)
+
+
+def lookups(cache, size: int, n_single: int, n_bulk: int, rng):
+    single = []
+    for i in rng.integers(size, size=n_single):
+        t0 = time.perf_counter()
+        if cache.exists(_name(int(i)), _hash(int(i))):
+            cache.get_embedding(_name(int(i)))
+        single.append((time.perf_counter() - t0) * 1000)
+
+    names = [_name(int(i)) for i in rng.integers(size, size=min(n_bulk, size))]
+    t0 = time.perf_counter()
+    for f in names:
+        cache.get_embedding(f)
+    bulk_ms = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    meta, embeddings = cache.all_embeddings()
+    # touch the rows so lazily mapped backends pay for the read
+    np.asarray(embeddings[: len(meta)]).sum()
+    all_ms = (time.perf_counter() - t0) * 1000
+
+    return {
+        "single": percentiles(single),
+        "bulk": {"n": len(names), "elapsed_ms": bulk_ms, "ms_per_vector": bulk_ms / len(names) if names else 0.0},
+        "all_embeddings_ms": all_ms,
+    }
+
+
+def _startup_child(spec: str, cache_dir: str, queue):
+    try:
+        backend = load_backend(spec)
+        before = rss_mb()
+        t0 = time.perf_counter()
+        cache = backend(cache_dir=cache_dir)
+        elapsed = time.perf_counter() - t0
+        # first lookup included separately: some backends defer work until then
+        t1 = time.perf_counter()
+        cache.exists(_name(0), _hash(0))
+        first_ms = (time.perf_counter() - t1) * 1000
+        queue.put({
+            "startup_s": elapsed,
+            "first_lookup_ms": first_ms,
+            "rss_mb": rss_mb(),
+            "rss_delta_mb": rss_mb() - before,
+        })
+    except Exception:
+        queue.put({"error": traceback.format_exc()})
+
+
+def startup(spec: str, cache_dir: str, timeout: float = 600.0):
+    """
+    Cold-construct the backend in a fresh interpreter so nothing is shared
+    with the filler. A child that fails, dies or exceeds `timeout` seconds
+    yields {"error": ...} instead of hanging the run.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_startup_child, args=(spec, cache_dir, queue))
+    proc.start()
+    deadline = time.monotonic() + timeout
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=1.0)
+        except Empty:
+            if not proc.is_alive():
+                # killed before reporting (e.g. OOM, segfault); drain a result that raced the exit
+                try:
+                    result = queue.get(timeout=1.0)
+                except Empty:
+                    result = {"error": f"startup process exited with code {proc.exitcode} without a result"}
+            elif time.monotonic() > deadline:
+                proc.terminate()
+                result = {"error": f"startup timed out after {timeout:.0f}s"}
+    proc.join()
+    if "error" in result:
+        print(f"startup of {spec} failed: {result['error']}", file=sys.stderr)
+    return result
+
+
+def run_one(spec: str, size: int, args, workdir: str):
+    backend = load_backend(spec)
+    cache_dir = os.path.join(workdir, f"{backend.__name__}_{size}")
+    rng = np.random.default_rng(args.seed)
+
+    rss_before = rss_mb()
+    cache = backend(cache_dir=cache_dir)
+    result = {"backend": spec, "size": size, "dim": args.dim}
+    result["insert_bulk"] = fill(cache, size, args.dim, args.batch, rng)
+    result["insert_single"] = single_inserts(cache, size, args.dim, args.single_inserts, rng)
+    result["lookup"] = lookups(cache, size, args.lookups, args.bulk, rng)
+    result["filler_rss_delta_mb"] = rss_mb() - rss_before
+    del cache
+
+    result["startup"] = startup(spec, cache_dir, args.startup_timeout)
+    result["disk_mb"] = disk_mb(cache_dir)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backend", action="append", default=None,
+                        help=f"module:Class with the CacheManager interface (repeatable, default {DEFAULT_BACKEND})")
+    parser.add_argument("--sizes", default="10000,100000", help="comma-separated vector counts")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--batch", type=int, default=1000, help="vectors per add_embeddings call")
+    parser.add_argument("--single-inserts", type=int, default=100)
+    parser.add_argument("--lookups", type=int, default=1000, help="single-filename lookups")
+    parser.add_argument("--bulk", type=int, default=1000, help="filenames per bulk lookup")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--startup-timeout", type=float, default=600.0,
+                        help="seconds to wait for the fresh startup process")
+    parser.add_argument("--workdir", default=None, help="where caches are created (default: a temp dir)")
+    parser.add_argument("--out", default=None, help="write results JSON here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    backends = args.backend or [DEFAULT_BACKEND]
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    results = {
+        "benchmark": "cache",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": {"python": sys.version.split()[0], "machine": platform.machine(), "cpus": os.cpu_count()},
+        "config": {**vars(args), "backend": backends},
+        "runs": [],
+    }
+    with tempfile.TemporaryDirectory(prefix="bench_cache_", dir=args.workdir) as workdir:
+        for size in sizes:
+            for spec in backends:
+                print(f"{spec} @ {size} vectors ...", file=sys.stderr)
+                results["runs"].append(run_one(spec, size, args, workdir))
+
+    out = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(out)
+    else:
+        print(out)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# src/bench/benchmark_embedder.py
+"""
+Embedder backend benchmark: PyTorch vs ONNX Runtime (fp32 / int8).
+
+For each backend reports model load time, single-text latency
+percentiles (the per-query path), batch throughput in texts/s at each
+--batch-sizes entry (the ingestion path), and the cosine similarity of
+its embeddings to the PyTorch ones against COSINE_TOLERANCE.
+
+Texts are ~200-word passages cut from the .txt files under --folder (as
+doc_service chunks them), or synthetic sentences when no folder is given.
+
+    python -m src.bench.benchmark_embedder --backends torch,onnx,onnx-int8 --threads 4 --out embed_bench.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+
+import numpy as np
+
+from src.bench.benchmark_search import percentiles
+from src.embed_service.embedder import Embedder
+from src.embed_service.onnx_backend import COSINE_TOLERANCE, cosine_rows
+
+
+def load_texts(folder: str, n: int, seed: int = 0):
+    if folder:
+        from src.doc_service.utils import chunk_document, iter_text_files, read_document
+        texts = []
+        for filename, path, _, _ in iter_text_files(folder):
+            texts.extend(c["text"] for c in chunk_document(read_document(path, filename)["clean_text"]))
+            if len(texts) >= n:
+                break
+        if texts:
+            return texts[:n]
+    rng = np.random.default_rng(seed)
+    words = ("search engine document query vector index cache latency model embedding text passage "
+             "relevant result rank score user server request batch thread memory disk network").split()
+    return [" ".join(rng.choice(words, size=int(rng.integers(8, 160)))) for _ in range(n)]
+
+
+def bench_backend(backend: str, texts: list, queries: list, batch_sizes: list, threads: int):
+    t0 = time.perf_counter()
+    embedder = Embedder(backend=backend, threads=threads)
+    load_s = time.perf_counter() - t0
+    if embedder.backend != backend:
+        return {"backend": backend, "error": "backend unavailable, fell back to " + embedder.backend}, None
+
+    embedder.embed_batch(texts[:8])  # warm-up: first run allocates / optimizes the graph
+    single = []
+    for q in queries:
+        t0 = time.perf_counter()
+        embedder.embed_text(q)
+        single.append((time.perf_counter() - t0) * 1000)
+
+    throughput = []
+    embeddings = None
+    for batch_size in batch_sizes:
+        t0 = time.perf_counter()
+        out = [embedder.model.encode(texts[i:i + batch_size], convert_to_numpy=True, batch_size=batch_size)
+               for i in range(0, len(texts), batch_size)]
+        elapsed = time.perf_counter() - t0
+        throughput.append({"batch_size": batch_size, "elapsed_s": elapsed, "texts_per_s": len(texts) / elapsed})
+        embeddings = np.concatenate(out).astype("float32")
+
+    return {
+        "backend": backend,
+        "load_s": load_s,
+        "single_text": percentiles(single),
+        "batch": throughput,
+    }, embeddings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8")
+    parser.add_argument("--threads", type=int, default=None, help="intra-op threads (default: runtime default)")
+    parser.add_argument("--folder", default=None, help="take passages from .txt files here")
+    parser.add_argument("--texts", type=int, default=512, help="passages for the throughput runs")
+    parser.add_argument("--queries", type=int, default=200, help="single-text latency samples")
+    parser.add_argument("--batch-sizes", default="1,16,64")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="write results JSON here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    backends = [b for b in args.backends.split(",") if b]
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",") if b]
+    texts = load_texts(args.folder, args.texts, seed=args.seed)
+    # short query-like texts: the first few words of passages
+    queries = [" ".join(t.split()[:8]) for t in texts[:args.queries]]
+
+    results = {
+        "benchmark": "embedder",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": {"python": sys.version.split()[0], "machine": platform.machine(), "cpus": os.cpu_count()},
+        "config": vars(args),
+        "runs": [],
+    }
+    reference = None
+    for backend in backends:
+        print(f"benchmarking {backend} ...", file=sys.stderr)
+        run, embeddings = bench_backend(backend, texts, queries, batch_sizes, args.threads)
+        if backend == "torch":
+            reference = embeddings
+        results["runs"].append((run, embeddings))
+
+    for run, embeddings in results["runs"]:
+        if embeddings is None or reference is None or run["backend"] == "torch":
+            continue
+        sims = cosine_rows(embeddings, reference)
+        tolerance = COSINE_TOLERANCE["int8" if run["backend"] == "onnx-int8" else "fp32"]
+        run["vs_torch"] = {"min_cosine": float(sims.min()), "mean_cosine": float(sims.mean()),
+                           "tolerance": tolerance, "ok": bool(sims.min() >= tolerance)}
+    results["runs"] = [run for run, _ in results["runs"]]
+
+    out = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(out)
+    else:
+        print(out)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+# src/bench/benchmark_search.py
+"""
+Search latency / throughput benchmark.
+
+Offline (always): builds a synthetic corpus, runs each pipeline stage
+in-process and reports latency percentiles per stage:
+  embed   - Embedder.embed_text for one query
+  search  - FAISSIndexer.search_documents
+  fetch   - doc_service /get_docs for the hits (fields as the gateway asks)
+  explain - Explainer.explain_batch over the hits (LLM disabled)
+
+With --gateway, also measures end-to-end /search throughput of a running
+gateway at several concurrency levels. Results are written as JSON so two
+runs can be diffed for regressions.
+
+    python -m src.bench.benchmark_search --docs 5000 --stub --out bench.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import platform
+import tempfile
+
+import numpy as np
+
+
+# ---------------------------
+# STUB MODEL
+# ---------------------------
+class StubModel:
+    """
+    Deterministic stand-in for SentenceTransformer: a text is the normalized
+    sum of per-token random vectors, so texts sharing words stay close.
+    Needs no model download; latencies reflect the pipeline, not the model.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self._tokens = {}
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def _token(self, token: str):
+        vec = self._tokens.get(token)
+        if vec is None:
+            seed = int(hashlib.md5(token.encode("utf-8")).hexdigest()[:8], 16)
+            vec = np.random.default_rng(seed).standard_normal(self.dim).astype("float32")
+            self._tokens[token] = vec
+        return vec
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else texts
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for i, text in enumerate(texts):
+            for token in text.lower().split():
+                out[i] += self._token(token)
+        out /= np.linalg.norm(out, axis=1, keepdims=True) + 1e-10
+        return out[0] if single else out
+
+
+# ---------------------------
+# SYNTHETIC CORPUS
+# ---------------------------
+def make_corpus(folder: str, n_docs: int, words: int, vocab: int, seed: int = 0):
+    """Write n_docs Zipf-distributed word documents; returns their texts in filename order."""
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, vocab + 1)
+    weights /= weights.sum()
+    texts = []
+    for i in range(n_docs):
+        ids = rng.choice(vocab, size=words, p=weights)
+        # sentences of ~12 words so the explainer has something to split
+        tokens = [f"w{t}" for t in ids]
+        text = ". ".join(" ".join(tokens[j:j + 12]) for j in range(0, words, 12)) + "."
+        with open(os.path.join(folder, f"doc_{i:06d}.txt"), "w") as f:
+            f.write(text)
+        texts.append(text)
+    return texts
+
+
+def make_queries(texts: list, n_queries: int, seed: int = 1):
+    """Queries are short word runs copied from a random document (its filename is the answer)."""
+    rng = np.random.default_rng(seed)
+    queries = []
+    for _ in range(n_queries):
+        doc = int(rng.integers(len(texts)))
+        words = texts[doc].replace(".", "").split()
+        start = int(rng.integers(max(1, len(words) - 8)))
+        queries.append((" ".join(words[start:start + 6]), f"doc_{doc:06d}.txt"))
+    return queries
+
+
+def percentiles(samples_ms: list):
+    if not samples_ms:
+        return {"n": 0}
+    a = np.asarray(samples_ms)
+    return {
+        "n": len(a),
+        "mean_ms": float(a.mean()),
+        "p50_ms": float(np.percentile(a, 50)),
+        "p95_ms": float(np.percentile(a, 95)),
+        "p99_ms": float(np.percentile(a, 99)),
+        "max_ms": float(a.max()),
+    }
+
+
+def _timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, (time.perf_counter() - t0) * 1000
+
+
+# ---------------------------
+# OFFLINE STAGES
+# ---------------------------
+def run_offline(args, workdir: str):
+    os.environ["DOC_MANIFEST_PATH"] = os.path.join(workdir, "doc_manifest.json")
+    os.environ["DOC_STORE_PATH"] = os.path.join(workdir, "doc_store.sqlite3")
+    from src.doc_service import app as doc_app
+    from src.doc_service.utils import chunk_document
+    from src.embed_service.embedder import Embedder
+    from src.explain_service.explainer import Explainer
+    from src.explain_service.sentence_store import SentenceStore
+    from src.search_service.indexer import FAISSIndexer
+
+    corpus_dir = os.path.join(workdir, "docs")
+    os.makedirs(corpus_dir)
+    t0 = time.perf_counter()
+    texts = make_corpus(corpus_dir, args.docs, args.words, args.vocab, seed=args.seed)
+    queries = make_queries(texts, args.queries, seed=args.seed + 1)
+    setup = {"corpus_s": time.perf_counter() - t0}
+
+    model = StubModel(args.dim) if args.stub else None
+    embedder = Embedder(model=model)
+    explainer = Explainer(model=model, sentence_store=SentenceStore(os.path.join(workdir, "sentences")))
+    explainer.client = None  # offline: measure sentence selection, never the LLM
+
+    # ingest: the same steps /initialize drives through the services
+    _, ms = _timed(doc_app.load_docs, doc_app.FolderRequest(folder=corpus_dir, limit=args.docs))
+    setup["load_docs_s"] = ms / 1000
+    docs = doc_app.get_docs(doc_app.GetDocsRequest(filenames=sorted(doc_app._STORE.filenames()), fields=["hash", "clean_text"]))["documents"]
+
+    t0 = time.perf_counter()
+    chunk_texts, chunk_files, chunk_offsets = [], [], []
+    for doc in docs:
+        for chunk in chunk_document(doc["clean_text"]):
+            chunk_texts.append(chunk["text"])
+            chunk_files.append(doc["filename"])
+            chunk_offsets.append(chunk["offset"])
+    embeddings = embedder.embed_batch(chunk_texts)
+    setup["embed_corpus_s"] = time.perf_counter() - t0
+
+    indexer = FAISSIndexer()
+    indexer.index_path = os.path.join(workdir, "faiss_index.bin")
+    indexer.meta_path = os.path.join(workdir, "faiss_meta.pkl")
+    indexer.config_path = os.path.join(workdir, "faiss_config.json")
+    config = {}
+    if args.index_type:
+        config["index_type"] = args.index_type
+    if args.storage:
+        config["storage"] = args.storage
+    report, ms = _timed(
+        indexer.build, embeddings, {i: f for i, f in enumerate(chunk_files)}, config,
+        hashes={d["filename"]: d["hash"] for d in docs}, offsets=chunk_offsets,
+    )
+    setup["build_index_s"] = ms / 1000
+    setup["vectors"] = int(embeddings.shape[0])
+
+    _, ms = _timed(explainer.index_sentences, [(d["hash"], d["clean_text"]) for d in docs])
+    setup["index_sentences_s"] = ms / 1000
+
+    # per-query stages
+    stages = {"embed": [], "search": [], "fetch": [], "explain": [], "total": []}
+    found = 0
+    for query, expected in queries:
+        q_emb, t_embed = _timed(embedder.embed_text, query)
+        hits, t_search = _timed(indexer.search_documents, q_emb, args.top_k)
+        filenames = [h["filename"] for h in hits]
+        fetched, t_fetch = _timed(
+            doc_app.get_docs, doc_app.GetDocsRequest(filenames=filenames, fields=["clean_text", "hash"]),
+        )
+        hit_docs = fetched["documents"]
+        _, t_explain = _timed(
+            explainer.explain_batch, query, [d["clean_text"] for d in hit_docs], hashes=[d["hash"] for d in hit_docs],
+        )
+        for name, ms in (("embed", t_embed), ("search", t_search), ("fetch", t_fetch), ("explain", t_explain)):
+            stages[name].append(ms)
+        stages["total"].append(t_embed + t_search + t_fetch + t_explain)
+        found += expected in filenames
+
+    return {
+        "setup": setup,
+        "index_report": report,
+        "stages": {name: percentiles(samples) for name, samples in stages.items()},
+        "hit_rate_at_k": found / len(queries) if queries else 0.0,
+    }, [q for q, _ in queries]
+
+
+# ---------------------------
+# GATEWAY THROUGHPUT
+# ---------------------------
+async def _throughput_level(client, url: str, queries: list, concurrency: int, n_requests: int, top_k: int):
+    limit = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i):
+        nonlocal errors
+        async with limit:
+            payload = {"query": queries[i % len(queries)], "top_k": top_k, "include_full_text": False}
+            t0 = time.perf_counter()
+            try:
+                r = await client.post(url, json=payload, timeout=120)
+                ok = r.status_code == 200 and "error" not in r.json()
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - t0) * 1000)
+            else:
+                errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n_requests)))
+    elapsed = time.perf_counter() - t0
+    return {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency": percentiles(latencies),
+    }
+
+
+async def run_gateway(gateway: str, queries: list, levels: list, n_requests: int, top_k: int):
+    import httpx
+
+    url = gateway.rstrip("/") + "/search"
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(limits=limits) as client:
+        # one warm-up pass so connection setup and cold caches are not measured
+        await _throughput_level(client, url, queries, 1, min(len(queries), 5), top_k)
+        return [await _throughput_level(client, url, queries, c, n_requests, top_k) for c in levels]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--docs", type=int, default=2000, help="synthetic corpus size")
+    parser.add_argument("--words", type=int, default=300, help="words per document")
+    parser.add_argument("--vocab", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384, help="embedding dimension of the stub model")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--index-type", default=None, help="flat | ivf_flat | ivf_pq | hnsw (default: FAISS_INDEX_TYPE)")
+    parser.add_argument("--storage", default=None, help="float32 | float16 | sq8 (default: FAISS_STORAGE)")
+    parser.add_argument("--stub", action="store_true", help="use the stub model instead of all-MiniLM-L6-v2")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--gateway", default=None, help="gateway URL, e.g. http://localhost:8000")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--out", default=None, help="write results JSON here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    results = {
+        "benchmark": "search",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": {"python": sys.version.split()[0], "machine": platform.machine(), "cpus": os.cpu_count()},
+        "config": vars(args),
+    }
+    with tempfile.TemporaryDirectory(prefix="bench_search_") as workdir:
+        offline, queries = run_offline(args, workdir)
+    results["offline"] = offline
+
+    if args.gateway:
+        levels = [int(c) for c in args.concurrency.split(",") if c]
+        results["gateway"] = asyncio.run(run_gateway(args.gateway, queries, levels, args.requests, args.top_k))
+
+    out = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(out)
+    else:
+        print(out)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+# src/common/corpus.py
+import hashlib
+
+
+def fingerprint(hashes: dict) -> str:
+    """
+    Digest of a corpus as {filename: content hash}. doc_service computes it
+    over the scanned files and the search service over the indexed ones, so
+    equal fingerprints mean the index is up to date.
+    """
+    digest = hashlib.sha256()
+    for filename in sorted(hashes):
+        digest.update(f"{filename}\0{hashes[filename]}\n".encode("utf-8"))
+    return digest.hexdigest()
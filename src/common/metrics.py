@@ -0,0 +1,236 @@
+# src/common/metrics.py
+"""
+Prometheus-text metrics and request tracing shared by the services.
+
+instrument(app, service) wraps an app so that every HTTP request is
+counted and timed (http_requests_total, http_request_duration_seconds,
+http_requests_in_flight), serves GET /metrics in the text exposition
+format, and carries an X-Request-ID: taken from the incoming header or
+generated, echoed on the response and added to outgoing httpx calls made
+with propagate_request_id as a request hook.
+
+stage(name) times one step of the pipeline into stage_duration_seconds
+and into the current request's timings (see current_timings()).
+"""
+import math
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+REQUEST_ID_HEADER = "X-Request-ID"
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+_service = contextvars.ContextVar("service", default="unknown")
+_timings = contextvars.ContextVar("timings", default=None)
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format(name: str, labels: tuple, value: float) -> str:
+    if labels:
+        body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels)
+        name = f"{name}{{{body}}}"
+    if math.isinf(value):
+        return f"{name} {'+Inf' if value > 0 else '-Inf'}"
+    return f"{name} {value!r}" if isinstance(value, float) else f"{name} {value}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_labels(labels), 0)
+
+    def collect(self):
+        with self._lock:
+            return [_format(self.name, k, v) for k, v in self._values.items()]
+
+
+class Gauge(Counter):
+    """Set/inc/dec gauge; with `fn`, the value is read from fn() at scrape time instead."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn=None):
+        super().__init__(name, help)
+        self.fn = fn
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_labels(labels)] = value
+
+    def collect(self):
+        if self.fn is not None:
+            return [_format(self.name, (), float(self.fn()))]
+        return super().collect()
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=BUCKETS):
+        self.name, self.help = name, help
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._series = {}  # labels -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self):
+        lines = []
+        with self._lock:
+            for key, (counts, total, count) in self._series.items():
+                for bound, c in zip(self.buckets, counts):
+                    le = "+Inf" if math.isinf(bound) else repr(bound)
+                    lines.append(_format(f"{self.name}_bucket", key + (("le", le),), c))
+                lines.append(_format(f"{self.name}_sum", key, total))
+                lines.append(_format(f"{self.name}_count", key, count))
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str, fn=None) -> Gauge:
+        return self._get(Gauge, name, help, fn=fn)
+
+    def histogram(self, name: str, help: str, buckets=BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+REQUESTS = REGISTRY.counter("http_requests_total", "HTTP requests by route and status")
+LATENCY = REGISTRY.histogram("http_request_duration_seconds", "HTTP request latency by route")
+IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "HTTP requests currently being served")
+STAGES = REGISTRY.histogram("stage_duration_seconds", "Time spent in one pipeline stage")
+
+
+# ---------------------------
+# REQUEST CONTEXT
+# ---------------------------
+def request_id():
+    return _request_id.get()
+
+
+def current_timings():
+    """Per-stage milliseconds recorded so far for the current request (stages run concurrently add up)."""
+    timings = _timings.get()
+    return {k: round(v, 3) for k, v in (timings or {}).items()}
+
+
+@contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        STAGES.observe(elapsed, service=_service.get(), stage=name)
+        timings = _timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed * 1000
+
+
+async def propagate_request_id(request):
+    """httpx event hook: forward the current request id to downstream services."""
+    rid = _request_id.get()
+    if rid:
+        request.headers[REQUEST_ID_HEADER] = rid
+
+
+# ---------------------------
+# ASGI MIDDLEWARE
+# ---------------------------
+class MetricsMiddleware:
+    def __init__(self, app, service: str):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        rid = headers.get(REQUEST_ID_HEADER.lower().encode(), b"").decode() or uuid.uuid4().hex
+        tokens = (_request_id.set(rid), _service.set(self.service), _timings.set({}))
+        status = [500]
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(REQUEST_ID_HEADER.lower().encode(), rid.encode())]
+            await send(message)
+
+        IN_FLIGHT.inc(service=self.service)
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            elapsed = time.perf_counter() - t0
+            IN_FLIGHT.dec(service=self.service)
+            # the route template, not the raw path, keeps label cardinality bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUESTS.inc(service=self.service, method=scope["method"], route=route, status=status[0])
+            LATENCY.observe(elapsed, service=self.service, route=route)
+            for var, token in zip((_request_id, _service, _timings), tokens):
+                var.reset(token)
+
+
+def instrument(app: FastAPI, service: str):
+    app.add_middleware(MetricsMiddleware, service=service)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+    return app
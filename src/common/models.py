@@ -0,0 +1,59 @@
+# src/common/models.py
+"""
+One loaded sentence-embedding model per (name, backend, threads) per
+process. The embed service's Embedder and the explain service's
+Explainer both get their model here, so when they run in the same
+process (monolith deployment) all-MiniLM-L6-v2 is loaded once.
+"""
+import os
+import threading
+
+# "torch" (SentenceTransformer), "onnx" (ONNX Runtime fp32) or "onnx-int8" (dynamic int8 quantized)
+EMBED_BACKEND = os.environ.get("EMBED_BACKEND", "torch")
+# intra-op threads for the model; unset = runtime default (all cores)
+EMBED_THREADS = int(os.environ.get("EMBED_THREADS", "0")) or None
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+_MODELS = {}  # (model_name, backend, threads) -> (model, backend actually used)
+_LOCK = threading.Lock()
+
+
+def _load_onnx(model_name, backend, threads):
+    try:
+        from src.embed_service.onnx_backend import OnnxEncoder
+        print(f"Loading embedding model: {model_name} ({backend})")
+        return OnnxEncoder(model_name, quantized=backend == "onnx-int8", threads=threads)
+    except Exception as e:
+        # missing onnxruntime, failed export or tolerance check: keep serving with PyTorch
+        print(f"ONNX backend unavailable ({e}); falling back to PyTorch")
+        return None
+
+
+def _load_torch(model_name, threads):
+    from sentence_transformers import SentenceTransformer
+    print(f"Loading embedding model: {model_name}")
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    return SentenceTransformer(model_name)
+
+
+def load_sentence_model(model_name="all-MiniLM-L6-v2", backend=None, threads=None):
+    """Returns (model, backend); backend is "torch" when an ONNX backend fell back."""
+    backend = backend or EMBED_BACKEND
+    threads = threads or EMBED_THREADS
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown embed backend {backend!r}, expected one of {BACKENDS}")
+    key = (model_name, backend, threads)
+    with _LOCK:
+        if key not in _MODELS:
+            model = _load_onnx(model_name, backend, threads) if backend != "torch" else None
+            if model is None:
+                backend_used = "torch"
+                torch_key = (model_name, "torch", threads)
+                model = _MODELS[torch_key][0] if torch_key in _MODELS else _load_torch(model_name, threads)
+                _MODELS[torch_key] = (model, "torch")
+            else:
+                backend_used = backend
+            _MODELS[key] = (model, backend_used)
+        return _MODELS[key]
@@ -0,0 +1,16 @@
+# src/common/text.py
+import hashlib
+
+
+def normalize_query(query: str) -> str:
+    """
+    Canonical form of a query (lowercased, whitespace collapsed). The embed
+    service's query cache and the explain service's result cache both key
+    on it, so the same query hits both however it was typed.
+    """
+    return " ".join(query.lower().split())
+
+
+def content_hash(text: str) -> str:
+    # same digest doc_service uses for clean_text
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
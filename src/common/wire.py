@@ -0,0 +1,58 @@
+# src/common/wire.py
+"""
+Embedding wire format shared by the services.
+
+JSON lists of floats stay the default. A client that sends
+`X-Embedding-Format: base64` gets embeddings back packed as
+{"dtype": "float32", "shape": [...], "data": <base64 of little-endian bytes>},
+and every request field that takes an embedding list also accepts that form.
+In the monolith deployment the gateway asks for "in-process": arrays are
+handed over as numpy objects and never encoded at all.
+"""
+import base64
+from typing import Optional
+
+import numpy as np
+
+FORMAT_HEADER = "X-Embedding-Format"
+JSON = "json"
+BINARY = "base64"
+IN_PROCESS = "in-process"
+
+_WIRE_DTYPE = np.dtype("<f4")
+
+
+def encoding(fmt: Optional[str]) -> str:
+    """Normalize a requested format; anything unknown means JSON."""
+    fmt = (fmt or JSON).strip().lower()
+    return fmt if fmt in (BINARY, IN_PROCESS) else JSON
+
+
+def encode_matrix(arr) -> dict:
+    arr = np.ascontiguousarray(arr, dtype=_WIRE_DTYPE)
+    return {
+        "dtype": "float32",
+        "shape": list(arr.shape),
+        "data": base64.b64encode(arr.tobytes()).decode("ascii"),
+    }
+
+
+def decode_matrix(value) -> np.ndarray:
+    """Accept a (nested) JSON list, an encode_matrix() dict or an array; returns float32."""
+    if not isinstance(value, dict):
+        return np.asarray(value, dtype="float32")
+    if value.get("dtype", "float32") != "float32":
+        raise ValueError(f"unsupported embedding dtype: {value.get('dtype')}")
+    flat = np.frombuffer(base64.b64decode(value["data"]), dtype=_WIRE_DTYPE)
+    # copy: frombuffer views are read-only and faiss normalizes in place
+    return flat.reshape(value["shape"]).astype("float32")
+
+
+def pack(arr, fmt: str):
+    """Encode `arr` in the format the client asked for (see encoding())."""
+    fmt = encoding(fmt)
+    if fmt == BINARY:
+        return encode_matrix(arr)
+    if fmt == IN_PROCESS:
+        return np.asarray(arr, dtype="float32")
+    return np.asarray(arr).tolist()
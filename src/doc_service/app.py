@@ -1,38 +1,120 @@
 # src/doc_service/app.py
+from typing import List, Optional
 from fastapi import FastAPI
 from pydantic import BaseModel
-from src.doc_service.utils import preprocess_documents, load_original_text
+from src.common import corpus, metrics
+from src.doc_service.store import DocStore
+from src.doc_service.utils import DocManifest, scan_documents, chunk_document
 
-app = FastAPI(title="Document Service")
+import os
+
+app = metrics.instrument(FastAPI(title="Document Service"), "doc")
 
 class FolderRequest(BaseModel):
     folder: str
+    # paging over the scan; offset=0 (re)scans the folder, later pages reuse that scan
+    offset: int = 0
+    limit: int = 1000
+
+# documents of the last scan (metadata + text once read) live on disk and survive restarts
+_STORE = DocStore(os.environ.get("DOC_STORE_PATH", "cache/doc_store.sqlite3"))
+_MANIFEST = DocManifest(os.environ.get("DOC_MANIFEST_PATH", "cache/doc_manifest.json"))
+_CHANGED = set() # filenames read during the last scan (new or modified on disk)
+_FINGERPRINT = corpus.fingerprint(_STORE.hashes()) if len(_STORE) else None  # of the last scan (src/common/corpus.py)
+
+_TEXT_FIELDS = {"clean_text", "original_text", "chunks"}
+
+metrics.REGISTRY.gauge("documents_known", "Documents found by the last scan", fn=lambda: len(_STORE))
 
-# In-memory stores (simple)
-_DOCUMENTS = {}  # filename -> dict with clean_text, hash, length, original_text
+def _scan(folder: str):
+    global _FINGERPRINT
+    _CHANGED.clear()
+    paths = []
+    with _STORE.scan() as removed:
+        # files the manifest vouches for arrive without text: the store keeps the text it has
+        # for an unchanged hash and otherwise reads the file on first request
+        for seq, (doc, changed) in enumerate(scan_documents(folder, _MANIFEST)):
+            _STORE.put(doc, seq)
+            if changed:
+                _CHANGED.add(doc["filename"])
+            paths.append(doc["path"])
+    _MANIFEST.retain(paths)
+    _MANIFEST.save()
+    _FINGERPRINT = corpus.fingerprint(_STORE.hashes())
+    return removed[0]
+
+def _get(filename: str, with_text: bool = True):
+    with metrics.stage("doc_read"):
+        return _STORE.get(filename, with_text)
 
 @app.post("/load_docs")
 def load_docs(req: FolderRequest):
     try:
-        docs = preprocess_documents(req.folder)
-        for d in docs:
-            _DOCUMENTS[d["filename"]] = {
-                "filename": d["filename"],
-                "clean_text": d["clean_text"],
-                "hash": d["hash"],
-                "length": d["length"],
-                "original_text": d["original_text"]
-            }
-        return {"count": len(docs), "documents": list(_DOCUMENTS.values())}
+        removed = 0
+        if req.offset == 0:
+            with metrics.stage("doc_scan"):
+                removed = _scan(req.folder)
+        count = len(_STORE)
+        documents = _STORE.page(req.offset, req.limit)
+        for doc in documents:
+            doc["changed"] = doc["filename"] in _CHANGED
+        next_offset = req.offset + req.limit if req.offset + req.limit < count else None
+        return {
+            "count": count,
+            "changed": len(_CHANGED),
+            "removed": removed,
+            "fingerprint": _FINGERPRINT,
+            "documents": documents,
+            "next_offset": next_offset,
+        }
     except Exception as e:
         return {"error": str(e)}
 
-@app.get("/get_doc/{filename}")
-def get_doc(filename: str):
-    if filename not in _DOCUMENTS:
+@app.get("/ready")
+def ready():
+    return {"ready": True, "documents": len(_STORE), "manifest_entries": len(_MANIFEST.entries)}
+
+@app.get("/get_doc/{filename:path}")
+def get_doc(filename: str, start: Optional[int] = None, end: Optional[int] = None):
+    # start / end: return only clean_text[start:end] as "text" (e.g. a preview) instead of the full document
+    if (start is not None and start < 0) or (end is not None and end < 0):
+        return {"error": "invalid_range", "message": "start and end must be non-negative"}
+    if start is None and end is None:
+        doc = _get(filename)
+    else:
+        doc = _get(filename, with_text=False)
+        if doc is not None:
+            with metrics.stage("doc_read"):
+                doc.update(start=start or 0, end=end, text=_STORE.text_range(filename, start or 0, end))
+    if doc is None:
         return {"error": "not_found", "message": f"{filename} not found"}
-    return _DOCUMENTS[filename]
+    return doc
+
+class GetDocsRequest(BaseModel):
+    filenames: List[str]
+    # subset of document keys to return (filename is always included); None = everything stored.
+    # "chunks" is computed on request: overlapping passages of clean_text with offsets + hashes
+    fields: Optional[List[str]] = None
+
+@app.post("/get_docs")
+def get_docs(req: GetDocsRequest):
+    needs_text = req.fields is None or bool(_TEXT_FIELDS.intersection(req.fields))
+    documents, missing = [], []
+    for filename in req.filenames:
+        doc = _get(filename, needs_text)
+        if doc is None:
+            missing.append(filename)
+            continue
+        if req.fields is not None:
+            projected = {k: doc[k] for k in ["filename", *req.fields] if k in doc}
+            if "chunks" in req.fields:
+                with metrics.stage("chunking"):
+                    projected["chunks"] = chunk_document(doc["clean_text"])
+            doc = projected
+        documents.append(doc)
+    return {"count": len(documents), "documents": documents, "missing": missing}
 
 @app.get("/all_docs")
 def all_docs():
-    return {"count": len(_DOCUMENTS), "documents": list(_DOCUMENTS.values())}
+    documents = [_get(f) for f in _STORE.filenames()]
+    return {"count": len(documents), "documents": [d for d in documents if d is not None]}
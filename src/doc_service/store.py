@@ -0,0 +1,193 @@
+# src/doc_service/store.py
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from src.doc_service.utils import read_document
+
+STORE_PATH = "cache/doc_store.sqlite3"
+
+# fields get() returns; the file path stays internal (only _read needs it)
+_META_FIELDS = ("filename", "hash", "length")
+_TEXT_FIELDS = ("clean_text", "original_text")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    filename TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,        -- position in the scan that last saw the file (walk order)
+    scan INTEGER NOT NULL,       -- id of that scan; rows from older scans are deleted files
+    path TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    clean_text TEXT,             -- NULL until the file is read
+    original_text TEXT
+);
+CREATE INDEX IF NOT EXISTS documents_seq ON documents (seq);
+"""
+
+
+class DocStore:
+    """
+    Documents of the last scan in an SQLite file: metadata for every file
+    plus its text once read. Nothing is held in memory; texts are read per
+    request, and text_range() returns a slice of clean_text without
+    materializing the rest in Python. The store outlives restarts, so
+    documents can be served before the first scan of a new process.
+
+    A scan writes through its own connection: WAL lets readers keep
+    serving the previous scan's snapshot until it commits.
+    """
+
+    def __init__(self, path: str = STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # one connection shared by FastAPI's worker threads, serialized per statement by the lock
+        self._conn = self._connect()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.RLock()
+        self._scan_lock = threading.RLock()  # one scan at a time; held for the whole scan
+        self._writer = None  # connection of the running scan
+        self._scan = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def __contains__(self, filename: str):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM documents WHERE filename = ?", (filename,)).fetchone() is not None
+
+    @contextmanager
+    def scan(self):
+        """
+        Record one folder scan as a single transaction: every document put()
+        inside it is stamped with the scan id, and documents the scan did not
+        see are deleted at the end. Yields a list that receives the number
+        of deleted rows.
+        """
+        removed = [0]
+        with self._scan_lock:
+            writer = self._connect()
+            try:
+                writer.execute("BEGIN IMMEDIATE")
+                self._scan = (writer.execute("SELECT MAX(scan) FROM documents").fetchone()[0] or 0) + 1
+                self._writer = writer
+                yield removed
+                removed[0] = writer.execute("DELETE FROM documents WHERE scan != ?", (self._scan,)).rowcount
+                writer.execute("COMMIT")
+            except BaseException:
+                if writer.in_transaction:
+                    writer.execute("ROLLBACK")
+                raise
+            finally:
+                self._writer = self._scan = None
+                writer.close()
+
+    def put(self, doc: dict, seq: int):
+        """
+        Insert or update a scanned document. Text is stored when `doc`
+        carries it; otherwise the stored text is kept if the hash still
+        matches and dropped (to be read on demand) if it does not.
+        Inside a scan it goes through the scan's connection.
+        """
+        with self._scan_lock:
+            if self._writer is not None:
+                self._put(self._writer, doc, seq)
+            else:
+                with self._lock:
+                    self._put(self._conn, doc, seq)
+
+    def _put(self, conn, doc: dict, seq: int):
+        conn.execute(
+            """
+            INSERT INTO documents (filename, seq, scan, path, hash, length, clean_text, original_text)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (filename) DO UPDATE SET
+                seq = excluded.seq, scan = excluded.scan, path = excluded.path, length = excluded.length,
+                clean_text = CASE WHEN excluded.clean_text IS NOT NULL THEN excluded.clean_text
+                                  WHEN hash = excluded.hash THEN clean_text END,
+                original_text = CASE WHEN excluded.clean_text IS NOT NULL THEN excluded.original_text
+                                     WHEN hash = excluded.hash THEN original_text END,
+                hash = excluded.hash
+            """,
+            (doc["filename"], seq, self._scan or 0, doc["path"], doc["hash"], doc["length"],
+             doc.get("clean_text"), doc.get("original_text")),
+        )
+
+    def page(self, offset: int, limit: int):
+        """Metadata of documents [offset, offset + limit) in scan order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT filename, hash, length FROM documents ORDER BY seq LIMIT ? OFFSET ?", (limit, offset),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def hashes(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT filename, hash FROM documents").fetchall())
+
+    def filenames(self):
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT filename FROM documents ORDER BY seq")]
+
+    def _read(self, filename: str, path: str, file_hash: str):
+        # file not read since it was scanned (e.g. unchanged across restarts): read it now and keep the text,
+        # unless the file changed after the scan (the next scan picks that up) or a scan is writing right now
+        doc = read_document(path, filename)
+        if doc["hash"] != file_hash or self._writer is not None:
+            return doc
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "UPDATE documents SET clean_text = ?, original_text = ? WHERE filename = ? AND hash = ?",
+                    (doc["clean_text"], doc["original_text"], filename, file_hash),
+                )
+            except sqlite3.OperationalError:
+                pass  # a scan took the write lock meanwhile; the text is read again next time
+        return doc
+
+    def get(self, filename: str, with_text: bool = True):
+        """The stored document (metadata only unless with_text), or None."""
+        columns = ("path",) + _META_FIELDS + (_TEXT_FIELDS if with_text else ())
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(columns)} FROM documents WHERE filename = ?", (filename,),
+            ).fetchone()
+        if row is None:
+            return None
+        doc = dict(row)
+        path = doc.pop("path")
+        if with_text and doc["clean_text"] is None:
+            text = self._read(filename, path, doc["hash"])
+            doc.update((field, text[field]) for field in _TEXT_FIELDS)
+        return doc
+
+    def text_range(self, filename: str, start: int = 0, end: int = None):
+        """
+        clean_text[start:end] of a document (sliced by SQLite), or None if
+        unknown. Bounds are non-negative offsets; an end before start gives "".
+        """
+        if start < 0 or (end is not None and end < 0):
+            raise ValueError("start and end must be non-negative")
+        if end is None:
+            text_sql, args = "substr(clean_text, ?)", (start + 1,)
+        else:
+            text_sql, args = "substr(clean_text, ?, ?)", (start + 1, max(end - start, 0))
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT path, hash, clean_text IS NULL, {text_sql} FROM documents WHERE filename = ?", (*args, filename),
+            ).fetchone()
+        if row is None:
+            return None
+        path, file_hash, unread, text = row
+        if unread:
+            text = self._read(filename, path, file_hash)["clean_text"][start:None if end is None else end]
+        return text
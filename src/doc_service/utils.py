@@ -1,7 +1,19 @@
 # src/doc_service/utils.py
 import os
+import json
 import hashlib
 import re
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# MiniLM truncates input at 256 word pieces, roughly 200 words of English
+CHUNK_WORDS = 200
+CHUNK_OVERLAP = 40
+
+MANIFEST_PATH = "cache/doc_manifest.json"
+# capped by default: the pool competes with the services (and, in monolith mode, the model) for cores
+INGEST_WORKERS = int(os.environ.get("DOC_INGEST_WORKERS", str(min(os.cpu_count() or 1, 4))))
+INGEST_BATCH = 64
 
 def load_text_files(folder_path: str):
     docs = []
@@ -35,19 +47,147 @@ def compute_hash(text: str) -> str:
     return hashlib.md5(text.encode("utf-8")).hexdigest()
 
 
+def iter_chunks(text: str, window: int = CHUNK_WORDS, overlap: int = CHUNK_OVERLAP):
+    """
+    Yield (offset, passage) fixed-window passages of `window` words, each
+    overlapping the previous one by `overlap` words. `offset` is the character
+    position of the passage in `text`. Words are consumed one at a time, so
+    the whole word list is never materialized. Empty text yields one empty
+    passage so every document still gets a vector.
+    """
+    step = window - overlap
+    words, starts = [], []
+    fresh = 0  # words in the buffer not covered by an emitted passage
+    emitted = False
+    for m in re.finditer(r"\S+", text):
+        words.append(m.group())
+        starts.append(m.start())
+        fresh += 1
+        if len(words) == window:
+            yield starts[0], " ".join(words)
+            emitted = True
+            words, starts = words[step:], starts[step:]
+            fresh = 0
+    if fresh or not emitted:
+        yield (starts[0] if starts else 0), " ".join(words)
+
+
+def chunk_document(text: str):
+    return [
+        {"chunk": i, "offset": offset, "text": passage, "hash": compute_hash(passage)}
+        for i, (offset, passage) in enumerate(iter_chunks(text))
+    ]
+
+
+def iter_text_files(folder_path: str):
+    """
+    Walk `folder_path` recursively and yield (filename, path, size, mtime_ns)
+    for every .txt file, in sorted order. filename is the path relative to
+    the folder with "/" separators; nothing is read here.
+    """
+    for root, dirs, files in os.walk(folder_path):
+        dirs.sort()
+        for fname in sorted(files):
+            if not fname.endswith(".txt"):
+                continue
+            path = os.path.join(root, fname)
+            st = os.stat(path)
+            filename = os.path.relpath(path, folder_path).replace(os.sep, "/")
+            yield filename, path, st.st_size, st.st_mtime_ns
+
+
+def read_document(path: str, filename: str):
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        text = f.read()
+    cleaned = clean_text(text)
+    return {
+        "filename": filename,
+        "path": path,
+        "clean_text": cleaned,
+        "hash": compute_hash(cleaned),
+        "length": len(cleaned.split()),
+        "original_text": text
+    }
+
+
+class DocManifest:
+    """path -> {size, mtime, hash, length} of every file seen by the last scan, persisted as JSON."""
+
+    def __init__(self, path: str = MANIFEST_PATH):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+
+    def lookup(self, path: str, size: int, mtime: int):
+        entry = self.entries.get(path)
+        if entry is not None and entry["size"] == size and entry["mtime"] == mtime:
+            return entry
+        return None
+
+    def record(self, path: str, size: int, mtime: int, doc: dict):
+        self.entries[path] = {"size": size, "mtime": mtime, "hash": doc["hash"], "length": doc["length"]}
+
+    def retain(self, paths):
+        paths = set(paths)
+        self.entries = {p: e for p, e in self.entries.items() if p in paths}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+
+def _pool(workers: int):
+    # spawn, not fork: scans run on a FastAPI worker thread, and forking a process that also runs the
+    # batcher and torch/ONNX threads (monolith mode) can deadlock the children on a lock held mid-fork
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _read_batch(pool, pending, manifest):
+    paths = [p[1] for p in pending]
+    filenames = [p[0] for p in pending]
+    docs = pool.map(read_document, paths, filenames, chunksize=8) if pool else map(read_document, paths, filenames)
+    for (_, path, size, mtime), doc in zip(pending, docs):
+        manifest.record(path, size, mtime, doc)
+        yield doc, True
+
+
+def scan_documents(folder_path: str, manifest: DocManifest, workers: int = INGEST_WORKERS):
+    """
+    Yield (doc, changed) for every .txt file under `folder_path`.
+
+    Files whose (size, mtime) match the manifest are not opened: they are
+    yielded as metadata only (filename, path, hash, length) with changed=False.
+    Everything else is read, cleaned and hashed by a spawned process pool
+    in batches of INGEST_BATCH and yielded in full with changed=True. The
+    caller is expected to save the manifest once the scan is done.
+    """
+    pool = None
+    pending = []
+    try:
+        for filename, path, size, mtime in iter_text_files(folder_path):
+            entry = manifest.lookup(path, size, mtime)
+            if entry is not None:
+                yield {"filename": filename, "path": path, "hash": entry["hash"], "length": entry["length"]}, False
+                continue
+            pending.append((filename, path, size, mtime))
+            if len(pending) >= INGEST_BATCH:
+                if pool is None and workers > 1:
+                    pool = _pool(workers)
+                yield from _read_batch(pool, pending, manifest)
+                pending = []
+        if pending:
+            if pool is None and workers > 1 and len(pending) > 1:
+                pool = _pool(workers)
+            yield from _read_batch(pool, pending, manifest)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
 def preprocess_documents(folder_path: str):
-    raw_docs = load_text_files(folder_path)
-    result = []
-
-    for doc in raw_docs:
-        cleaned = clean_text(doc["text"])
-        h = compute_hash(cleaned)
-        result.append({
-            "filename": doc["filename"],
-            "clean_text": cleaned,
-            "hash": h,
-            "length": len(cleaned.split()),
-            "original_text": doc["text"]
-        })
-
-    return result
+    return [read_document(path, filename) for filename, path, _, _ in iter_text_files(folder_path)]
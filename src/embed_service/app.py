@@ -1,15 +1,51 @@
 # src/embed_service/app.py
-from fastapi import FastAPI
+from typing import Optional
+from fastapi import FastAPI, Header, Response
 from pydantic import BaseModel
+from src.common import metrics, wire
+from src.common.text import content_hash, normalize_query
+from src.embed_service.batcher import MicroBatcher
 from src.embed_service.embedder import Embedder
 from src.embed_service.cache_manager import CacheManager
+from src.embed_service.query_cache import QueryCache
 
+import os
 import numpy as np
 
-app = FastAPI(title="Embed Service")
+app = metrics.instrument(FastAPI(title="Embed Service"), "embed")
 
 embedder = Embedder()
 cache = CacheManager()
+# /compact without force only rewrites the vector file once this share of its rows is garbage
+CACHE_COMPACT_RATIO = float(os.environ.get("EMBED_CACHE_COMPACT_RATIO", "0.25"))
+# single-text encodes from concurrent requests share one forward pass; EMBED_MICROBATCH_WAIT_MS=0 disables
+MICROBATCH_SIZE = int(os.environ.get("EMBED_MICROBATCH_SIZE", "32"))
+MICROBATCH_WAIT_MS = float(os.environ.get("EMBED_MICROBATCH_WAIT_MS", "5"))
+batcher = MicroBatcher(embedder.embed_batch, MICROBATCH_SIZE, MICROBATCH_WAIT_MS) if MICROBATCH_WAIT_MS > 0 else None
+
+def _embed_one(text: str):
+    return batcher.encode(text) if batcher is not None else embedder.embed_text(text)
+# queries are throwaway: keep them in a bounded in-memory LRU, never in the document cache
+query_cache = QueryCache(
+    max_size=int(os.environ.get("QUERY_CACHE_SIZE", "1024")),
+    ttl=float(os.environ.get("QUERY_CACHE_TTL", "3600")),
+)
+
+CACHE_LOOKUPS = metrics.REGISTRY.counter("embed_cache_lookups_total", "Document embedding cache lookups by result")
+
+def _embed_cache_hit_ratio():
+    hits, misses = CACHE_LOOKUPS.value(result="hit"), CACHE_LOOKUPS.value(result="miss")
+    return hits / (hits + misses) if hits + misses else 0.0
+
+metrics.REGISTRY.gauge("embed_cache_hit_ratio", "Document embedding cache hit ratio", fn=_embed_cache_hit_ratio)
+metrics.REGISTRY.gauge("embed_cache_entries", "Filenames linked in the document cache", fn=lambda: len(cache.files))
+metrics.REGISTRY.gauge("embed_cache_vectors", "Distinct content hashes stored in the document cache", fn=lambda: len(cache.rows))
+metrics.REGISTRY.gauge("embed_cache_garbage_rows", "Unreferenced rows in the vector file", fn=lambda: cache.stats()["garbage_rows"])
+metrics.REGISTRY.gauge("query_cache_hit_ratio", "Query embedding LRU hit ratio", fn=lambda: query_cache.stats()["hit_ratio"])
+metrics.REGISTRY.gauge("query_cache_entries", "Query embeddings held in the LRU", fn=lambda: query_cache.stats()["size"])
+if batcher is not None:
+    metrics.REGISTRY.gauge("embed_microbatches", "Micro-batches encoded", fn=lambda: batcher.batches)
+    metrics.REGISTRY.gauge("embed_microbatch_mean_size", "Mean texts per micro-batch", fn=lambda: batcher.stats()["mean_batch_size"])
 
 class EmbedRequest(BaseModel):
     filename: str
@@ -18,47 +54,148 @@ class EmbedRequest(BaseModel):
 
 @app.post("/embed_document")
 def embed_document(req: EmbedRequest):
-    if cache.exists(req.filename, req.hash):
-        emb = cache.get_embedding(req.filename)
-        return {"filename": req.filename, "cached": True, "embedding": emb.tolist()}
-    emb = embedder.embed_text(req.text)
+    found = cache.lookup([req.filename], [req.hash])
+    if found:
+        CACHE_LOOKUPS.inc(result="hit")
+        return {"filename": req.filename, "cached": True, "embedding": found[0].tolist()}
+    CACHE_LOOKUPS.inc(result="miss")
+    with metrics.stage("embed_model"):
+        emb = _embed_one(req.text)
     cache.add_embedding(req.filename, req.hash, emb)
     return {"filename": req.filename, "cached": False, "embedding": emb.tolist()}
 
+class QueryRequest(BaseModel):
+    query: str
+
+@app.post("/embed_query")
+def embed_query(req: QueryRequest, x_embedding_format: Optional[str] = Header(None)):
+    fmt = wire.encoding(x_embedding_format)
+    emb = query_cache.get(req.query)
+    if emb is not None:
+        return {"cached": True, "embedding": wire.pack(emb, fmt)}
+    with metrics.stage("embed_model"):
+        emb = _embed_one(normalize_query(req.query))
+    query_cache.put(req.query, emb)
+    return {"cached": False, "embedding": wire.pack(emb, fmt)}
+
+class QueryBatchRequest(BaseModel):
+    queries: list
+
+@app.post("/embed_queries")
+def embed_queries(req: QueryBatchRequest, x_embedding_format: Optional[str] = Header(None)):
+    # row i of "embeddings" answers req.queries[i]; cache misses share one embed_batch call
+    matrix = np.empty((len(req.queries), embedder.dim()), dtype="float32")
+    cached = [False] * len(req.queries)
+    misses = []
+    for i, q in enumerate(req.queries):
+        emb = query_cache.get(q)
+        if emb is None:
+            misses.append(i)
+        else:
+            matrix[i] = emb
+            cached[i] = True
+    if misses:
+        with metrics.stage("embed_model"):
+            embs = embedder.embed_batch([normalize_query(req.queries[i]) for i in misses])
+        for i, emb in zip(misses, embs):
+            matrix[i] = emb
+            query_cache.put(req.queries[i], emb)
+    return {"cached": cached, "embeddings": wire.pack(matrix, x_embedding_format)}
+
+@app.get("/query_cache_stats")
+def query_cache_stats():
+    return query_cache.stats()
+
+@app.get("/batcher_stats")
+def batcher_stats():
+    return batcher.stats() if batcher is not None else {"enabled": False}
+
+@app.get("/ready")
+def ready(response: Response):
+    # the model is loaded at import; the micro-batcher thread must still be alive to serve queries
+    batcher_alive = batcher is None or batcher.alive
+    if not batcher_alive:
+        response.status_code = 503
+    return {"ready": batcher_alive, "backend": embedder.backend, "dim": embedder.dim(),
+            "cached_documents": len(cache.files), "batcher_alive": batcher_alive}
+
 class BatchEmbedRequest(BaseModel):
     docs: list
 
 @app.post("/embed_batch")
-def embed_batch(req: BatchEmbedRequest):
-    results = []
-    new_texts, new_files, new_hashes = [], [], []
-    for d in req.docs:
-        filename = d.get("filename")
-        file_hash = d.get("hash")
-        text = d.get("text") or d.get("clean_text") or ""
-        if cache.exists(filename, file_hash):
-            results.append({"filename": filename, "cached": True, "embedding": cache.get_embedding(filename).tolist()})
-        else:
-            new_files.append(filename)
-            new_hashes.append(file_hash)
-            new_texts.append(text)
+def embed_batch(req: BatchEmbedRequest, x_embedding_format: Optional[str] = Header(None)):
+    # results[i] always answers req.docs[i]; in non-JSON formats results carry no vectors and
+    # row i of the packed "embeddings" matrix belongs to req.docs[i]
+    fmt = wire.encoding(x_embedding_format)
+    filenames = [d.get("filename") for d in req.docs]
+    texts = [d.get("text") or d.get("clean_text") or "" for d in req.docs]
+    # the cache and the dedup below are keyed by content hash: hash what the caller did not
+    hashes = [d.get("hash") or content_hash(text) for d, text in zip(req.docs, texts)]
+    results = [None] * len(req.docs)
+    matrix = np.empty((len(req.docs), embedder.dim()), dtype="float32")
+    found = cache.lookup(filenames, hashes)
+    for i, emb in found.items():
+        matrix[i] = emb
+        results[i] = {"filename": filenames[i], "cached": True}
 
-    if new_texts:
-        new_embs = embedder.embed_batch(new_texts)
-        for fname, h, emb in zip(new_files, new_hashes, new_embs):
-            cache.add_embedding(fname, h, emb)
-            results.append({"filename": fname, "cached": False, "embedding": emb.tolist()})
+    # cache misses are keyed by content: repeated text in the batch is encoded once
+    new_slots = {}  # content hash -> positions in req.docs
+    for i, d in enumerate(req.docs):
+        if i not in found:
+            new_slots.setdefault(hashes[i], []).append(i)
+    CACHE_LOOKUPS.inc(len(found), result="hit")
+    CACHE_LOOKUPS.inc(len(req.docs) - len(found), result="miss")
+    if new_slots:
+        first = [slots[0] for slots in new_slots.values()]
+        with metrics.stage("embed_model"):
+            new_embs = embedder.embed_batch([texts[i] for i in first])
+        for slots, emb in zip(new_slots.values(), new_embs):
+            matrix[slots] = emb
+            for i in slots:
+                results[i] = {"filename": filenames[i], "cached": False}
+        missed = [i for slots in new_slots.values() for i in slots]
+        cache.add_embeddings([filenames[i] for i in missed], [hashes[i] for i in missed], matrix[missed])
 
+    if fmt != wire.JSON:
+        return {"count": len(results), "results": results, "embeddings": wire.pack(matrix, fmt)}
+    for r, emb in zip(results, matrix):
+        r["embedding"] = emb.tolist()
     return {"count": len(results), "results": results}
 
+@app.get("/embed_cache_stats")
+def embed_cache_stats():
+    return cache.stats()
+
+class ReleaseRequest(BaseModel):
+    filenames: list = []
+    # every cached name starting with one of these is released too (e.g. "doc.txt::" for its passages)
+    prefixes: list = []
+
+@app.post("/release")
+def release(req: ReleaseRequest):
+    return {"released": cache.release(req.filenames, req.prefixes), **cache.stats()}
+
+class CompactRequest(BaseModel):
+    # compact even when the garbage ratio is below EMBED_CACHE_COMPACT_RATIO
+    force: bool = False
+
+@app.post("/compact")
+def compact(req: CompactRequest):
+    stats = cache.stats()
+    if not req.force and stats["garbage_ratio"] < CACHE_COMPACT_RATIO:
+        return {"compacted": False, "dropped": 0, **stats}
+    with metrics.stage("cache_compact"):
+        dropped = cache.compact()
+    return {"compacted": True, "dropped": dropped, **cache.stats()}
+
 @app.get("/all_embeddings")
-def get_all_embeddings():
+def get_all_embeddings(x_embedding_format: Optional[str] = Header(None)):
     meta, embs = cache.all_embeddings()
-    return {"meta": meta, "embeddings": embs.tolist()}
+    return {"meta": meta, "embeddings": wire.pack(embs, x_embedding_format)}
 
 # convenience endpoint called earlier by older code
 @app.post("/embed_all")
 def embed_all_docs(docs: list):
     # docs: list of {filename, clean_text, hash}
     batch = {"docs": [{"filename": d["filename"], "text": d.get("clean_text") or d.get("text", ""), "hash": d["hash"]} for d in docs]}
-    return embed_batch(BatchEmbedRequest(**batch))
+    return embed_batch(BatchEmbedRequest(**batch), x_embedding_format=None)
@@ -0,0 +1,78 @@
+# src/embed_service/batcher.py
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Coalesces single-text encode calls from concurrent requests.
+
+    Callers submit one text and get a Future. A worker thread takes the
+    first waiting text, keeps collecting until `max_batch` texts are queued
+    or `max_wait_ms` has passed since that first text, then runs one
+    `encode_batch(texts)` call and resolves every caller's future with its
+    row. A lone request therefore waits at most max_wait_ms extra.
+    """
+
+    def __init__(self, encode_batch, max_batch: int = 32, max_wait_ms: float = 5.0):
+        self.encode_batch = encode_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.texts = 0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="embed-microbatcher", daemon=True)
+        self._worker.start()
+
+    @property
+    def alive(self) -> bool:
+        """Whether the worker thread is running (queued texts are only encoded while it is)."""
+        return self._worker.is_alive()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, text: str):
+        return self.submit(text).result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = self.encode_batch(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(batch)
+            for (_, future), emb in zip(batch, embeddings):
+                future.set_result(emb)
+
+    def stats(self):
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch_size": self.texts / self.batches if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
@@ -1,48 +1,294 @@
 # src/embed_service/cache_manager.py
 import os
+import re
 import json
+import threading
 import numpy as np
 
+from src.embed_service.vector_store import MmapVectorStore
+
 CACHE_DIR = "cache"
-META_PATH = f"{CACHE_DIR}/embed_meta.json"
-EMB_PATH = f"{CACHE_DIR}/embeddings.npy"
+META_FILE = "embed_meta.json"
+EMB_FILE = "embeddings.npy"
+STORE_FILE = "embed_store.json"
+JOURNAL_FILE = "embed_journal.jsonl"
+META_VERSION = 2
+# the journal is folded into the meta file once it holds this many changes or as many as the cache has names,
+# whichever is larger: checkpoints cost O(cache) but come every O(cache) changes, so writes stay O(batch)
+CHECKPOINT_MIN_CHANGES = int(os.environ.get("EMBED_CACHE_CHECKPOINT_MIN", "1000"))
+# compacted vector files are written under a new generation name, see compact()
+_VECTOR_FILE = re.compile(r"embeddings(\.\d+)?\.npy(\.tmp)?")
 
 class CacheManager:
-    def __init__(self):
-        os.makedirs(CACHE_DIR, exist_ok=True)
-        if os.path.exists(META_PATH):
-            with open(META_PATH, "r") as f:
-                self.meta = json.load(f)
-        else:
-            self.meta = {}  # filename -> {"hash":..., "index": int}
-
-        if os.path.exists(EMB_PATH):
-            self.embeddings = np.load(EMB_PATH)
-        else:
-            # empty array shaped (0, dim) — we'll resize when first embedding arrives
-            self.embeddings = np.zeros((0, 384), dtype="float32")
+    """
+    Content-addressed embedding cache.
+
+    Vectors are stored once per content hash (`rows`: hash -> row index)
+    and filenames point at a hash (`files`: filename -> hash), so identical
+    content under several names is embedded once. `refs` counts the
+    filenames per hash; a row whose count drops to zero is garbage but stays
+    readable (a name linking back to it revives it) until compact() rewrites
+    the vector file without it.
+
+    Metadata is persisted in two parts. The meta file is a checkpoint: all
+    names and rows, the vector file in use and its row count, replaced
+    atomically. Each write after it appends one line to the journal (the
+    rows, links and unlinks of that batch), so a write costs O(batch)
+    rather than O(cache). Both carry a checkpoint id; a journal whose id
+    does not match the meta is stale and ignored, and a torn last line is
+    dropped. Compaction writes a new vector file next to the old one and
+    only switches to it through a checkpoint, so a crash at any point
+    leaves the metadata and the vectors it points at consistent.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.meta_path = os.path.join(cache_dir, META_FILE)
+        self.journal_path = os.path.join(cache_dir, JOURNAL_FILE)
+        os.makedirs(cache_dir, exist_ok=True)
+        self.files = {}  # filename -> content hash
+        self.rows = {}   # content hash -> row index in the vector store
+        self.refs = {}   # content hash -> number of filenames pointing at it
+        self._lock = threading.RLock()
+        self._checkpoint = 0      # id shared by the meta file and the journal that continues it
+        self._journaled = 0       # changes in the journal since that checkpoint
+        vectors, current = {"file": EMB_FILE}, True
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r") as f:
+                vectors, current = self._load_meta(json.load(f))
+        vectors, replayed = self._replay_journal(vectors)
+        for file_hash in self.files.values():
+            self.refs[file_hash] = self.refs.get(file_hash, 0) + 1
+
+        # rows are appended in place; the file is mapped, not read, on startup
+        self.store = MmapVectorStore(
+            os.path.join(cache_dir, vectors["file"]),
+            os.path.join(cache_dir, STORE_FILE),
+        )
+        if "count" in vectors:
+            # the header may lag the metadata after a crash mid-write; the metadata wins
+            self.store.count = vectors["count"]
+        self._remove_stale_vector_files()
+        if replayed or not current or not os.path.exists(self.journal_path):
+            # start from a clean checkpoint: folds the journal in (dropping a torn tail), migrates old metas
+            # and gives a new cache the journal header later writes append to
+            self.save()
+
+    def _load_meta(self, meta: dict):
+        """Fill files/rows from a meta file; returns its vector file entry and whether it is current."""
+        vectors = {"file": EMB_FILE}
+        if meta.get("version") == META_VERSION:
+            self.files = meta["files"]
+            self.rows = meta["rows"]
+            self._checkpoint = meta.get("checkpoint", 0)
+            return meta.get("vectors", vectors), True
+        # filename -> {"hash", "index"} (older caches): the first row seen per hash is kept,
+        # rows of duplicate content become garbage for the next compaction
+        for filename, entry in meta.items():
+            self.files[filename] = entry["hash"]
+            self.rows.setdefault(entry["hash"], int(entry["index"]))
+        return vectors, False
+
+    def _replay_journal(self, vectors: dict):
+        """Apply the journal lines written after the loaded checkpoint; returns the vector entry and whether any were."""
+        if not os.path.exists(self.journal_path):
+            return vectors, False
+        replayed = False
+        with open(self.journal_path, "r") as f:
+            header = f.readline()
+            try:
+                stale = json.loads(header).get("checkpoint") != self._checkpoint
+            except ValueError:
+                stale = True
+            if stale:
+                # left over from before the last checkpoint, which already contains it
+                return vectors, True
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # torn by a crash mid-append; everything before it is intact
+                self.rows.update(entry.get("rows", {}))
+                for filename in entry.get("unlink", ()):
+                    self.files.pop(filename, None)
+                self.files.update(entry.get("files", {}))
+                vectors = {**vectors, "count": entry["count"]}
+                replayed = True
+        return vectors, replayed
+
+    def _remove_stale_vector_files(self):
+        # leftovers of a compaction interrupted before or after its meta write
+        current = os.path.basename(self.store.path)
+        for name in os.listdir(self.cache_dir):
+            if name != current and _VECTOR_FILE.fullmatch(name):
+                os.remove(os.path.join(self.cache_dir, name))
+
+    @property
+    def embeddings(self):
+        return self.store.view()
+
+    @property
+    def meta(self):
+        """filename -> {"hash", "index"}, the per-file view of the cache."""
+        return {f: {"hash": h, "index": self.rows[h]} for f, h in self.files.items()}
 
     def save(self):
-        with open(META_PATH, "w") as f:
-            json.dump(self.meta, f, indent=2)
-        np.save(EMB_PATH, self.embeddings)
+        """Checkpoint: write the full meta file and start an empty journal."""
+        with self._lock:
+            self.store.flush()
+            self._write_meta(self.rows, os.path.basename(self.store.path), len(self.store))
+
+    def _write_meta(self, rows: dict, vector_file: str, count: int):
+        checkpoint = self._checkpoint + 1
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "version": META_VERSION,
+                "checkpoint": checkpoint,
+                "files": self.files,
+                "rows": rows,
+                "vectors": {"file": vector_file, "count": count},
+            }, f)
+        os.replace(tmp_path, self.meta_path)
+        # a crash before the journal is replaced leaves the old one, whose checkpoint id no longer matches
+        self._checkpoint = checkpoint
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps({"checkpoint": checkpoint}) + "\n")
+        os.replace(tmp_path, self.journal_path)
+        self._journaled = 0
+
+    def _log(self, rows=None, files=None, unlink=()):
+        """Persist one batch of changes: a journal line, or a checkpoint when the journal is long enough."""
+        self._journaled += len(rows or ()) + len(files or ()) + len(unlink)
+        if self._journaled >= max(CHECKPOINT_MIN_CHANGES, len(self.files)):
+            self.save()
+            return
+        self.store.flush()
+        entry = {"count": len(self.store)}
+        if rows:
+            entry["rows"] = rows
+        if files:
+            entry["files"] = files
+        if unlink:
+            entry["unlink"] = list(unlink)
+        with open(self.journal_path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def _next_vector_file(self) -> str:
+        match = re.fullmatch(r"embeddings\.(\d+)\.npy", os.path.basename(self.store.path))
+        return f"embeddings.{int(match.group(1)) + 1 if match else 1}.npy"
+
+    def _link(self, filename: str, file_hash: str) -> bool:
+        """Point `filename` at `file_hash`; returns whether anything changed."""
+        old = self.files.get(filename)
+        if old == file_hash:
+            return False
+        if old is not None:
+            self.refs[old] -= 1
+        self.files[filename] = file_hash
+        self.refs[file_hash] = self.refs.get(file_hash, 0) + 1
+        return True
 
     def exists(self, filename: str, file_hash: str) -> bool:
-        return filename in self.meta and self.meta[filename]["hash"] == file_hash
+        return self.files.get(filename) == file_hash
 
     def get_embedding(self, filename: str):
-        idx = int(self.meta[filename]["index"])
-        return self.embeddings[idx]
+        with self._lock:
+            return self.store.get(self.rows[self.files[filename]])
+
+    def lookup(self, filenames: list, hashes: list):
+        """
+        Cached vectors for (filename, hash) pairs, matched by content hash:
+        returns {position: vector} for every hit and links each hit's
+        filename to it (so a renamed or copied file is a hit).
+        """
+        found, linked = {}, {}
+        with self._lock:
+            for i, (filename, file_hash) in enumerate(zip(filenames, hashes)):
+                row = self.rows.get(file_hash)
+                if row is None:
+                    continue
+                if self._link(filename, file_hash):
+                    linked[filename] = file_hash
+                found[i] = np.array(self.store.get(row))
+            if linked:
+                self._log(files=linked)
+        return found
 
     def add_embedding(self, filename: str, file_hash: str, embedding):
-        embedding = embedding.astype("float32")
-        idx = len(self.embeddings)
-        self.meta[filename] = {"hash": file_hash, "index": idx}
-        if self.embeddings.shape[0] == 0:
-            self.embeddings = embedding.reshape(1, -1)
-        else:
-            self.embeddings = np.vstack([self.embeddings, embedding.reshape(1, -1)])
-        self.save()
+        self.add_embeddings([filename], [file_hash], [embedding])
+
+    def add_embeddings(self, filenames: list, hashes: list, embeddings):
+        """Store a batch of embeddings (one row per new content hash) and journal it once."""
+        if not filenames:
+            return
+        embeddings = np.asarray(embeddings, dtype="float32").reshape(len(filenames), -1)
+        with self._lock:
+            new, rows, linked = {}, {}, {}
+            for i, file_hash in enumerate(hashes):
+                if file_hash not in self.rows and file_hash not in new:
+                    new[file_hash] = i
+            if new:
+                start = self.store.append(embeddings[list(new.values())])
+                for j, file_hash in enumerate(new):
+                    rows[file_hash] = start + j
+                self.rows.update(rows)
+            for filename, file_hash in zip(filenames, hashes):
+                if self._link(filename, file_hash):
+                    linked[filename] = file_hash
+            if rows or linked:
+                self._log(rows=rows, files=linked)
+
+    def release(self, filenames=(), prefixes=()):
+        """
+        Unlink filenames (exact names, or every name starting with one of
+        `prefixes`); their rows become garbage once no other name uses them.
+        Returns the number of names released.
+        """
+        with self._lock:
+            prefixes = tuple(prefixes)
+            names = set(f for f in filenames if f in self.files)
+            if prefixes:
+                names.update(f for f in self.files if f.startswith(prefixes))
+            for filename in names:
+                self.refs[self.files.pop(filename)] -= 1
+            if names:
+                self._log(unlink=sorted(names))
+        return len(names)
+
+    def stats(self):
+        with self._lock:
+            live = sum(1 for h in self.rows if self.refs.get(h, 0) > 0)
+            stored = len(self.store)
+        return {
+            "files": len(self.files),
+            "vectors": live,
+            "rows": stored,
+            "garbage_rows": stored - live,
+            "garbage_ratio": (stored - live) / stored if stored else 0.0,
+            "bytes": os.path.getsize(self.store.path) if os.path.exists(self.store.path) else 0,
+        }
+
+    def compact(self):
+        """Rewrite the vector file with only referenced rows; returns the number of rows dropped."""
+        with self._lock:
+            live = sorted((row, h) for h, row in self.rows.items() if self.refs.get(h, 0) > 0)
+            dropped = len(self.store) - len(live)
+            if dropped == 0:
+                return 0
+            old_path = self.store.path
+            new_file = self._next_vector_file()
+            new_path = os.path.join(self.cache_dir, new_file)
+            self.store.write_compacted(new_path, [row for row, _ in live])
+            rows = {h: i for i, (_, h) in enumerate(live)}
+            # commit point (a checkpoint): from here on a restart loads the compacted file
+            self._write_meta(rows, new_file, len(live))
+            self.store.switch(new_path, len(live))
+            self.rows = rows
+            self.refs = {h: n for h, n in self.refs.items() if n > 0}
+            os.remove(old_path)
+        return dropped
 
     def all_embeddings(self):
         return self.meta, self.embeddings
@@ -1,11 +1,15 @@
 # src/embed_service/embedder.py
-from sentence_transformers import SentenceTransformer
+from src.common.models import load_sentence_model
 import numpy as np
 
 class Embedder:
-    def __init__(self, model_name="all-MiniLM-L6-v2"):
-        print(f"Loading embedding model: {model_name}")
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name="all-MiniLM-L6-v2", model=None, backend=None, threads=None):
+        # `model`: an already loaded SentenceTransformer-compatible object (encode + dimension);
+        # otherwise the process-wide shared instance for EMBED_BACKEND / `backend`
+        if model is None:
+            model, backend = load_sentence_model(model_name, backend, threads)
+        self.model = model
+        self.backend = backend
 
     def embed_text(self, text: str):
         emb = self.model.encode(text, convert_to_numpy=True)
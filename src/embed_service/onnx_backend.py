@@ -0,0 +1,232 @@
+# src/embed_service/onnx_backend.py
+"""
+ONNX Runtime encoder for sentence-transformers models.
+
+The first use exports the model's transformer to
+{ONNX_DIR}/{model_name}/model.onnx (plus an int8 dynamically quantized
+model.int8.onnx when asked), saves the tokenizer next to it and checks the
+result against the PyTorch model on PROBE_SENTENCES. The export is built
+in a temporary directory and only models that pass the check are moved
+into place; export_report.json records failures, and a variant reported
+as failed is never loaded. Later starts load only the tokenizer and the
+ONNX session; torch is not imported.
+
+OnnxEncoder has the encode() / get_sentence_embedding_dimension() surface
+that Embedder and Explainer use, so it drops in for SentenceTransformer.
+"""
+import os
+import json
+import shutil
+import inspect
+
+import numpy as np
+
+ONNX_DIR = "cache/onnx"
+OPSET = 14
+
+# minimum cosine similarity between ONNX and PyTorch embeddings of the same text
+COSINE_TOLERANCE = {"fp32": 0.9999, "int8": 0.98}
+
+PROBE_SENTENCES = [
+    "How do I reset my password?",
+    "The engine overheats after a few miles on the highway.",
+    "Quarterly revenue grew by twelve percent compared to last year.",
+    "a",
+    "Semantic search ranks documents by meaning rather than exact keyword matches, "
+    "which helps when users phrase questions differently from the source text.",
+]
+
+
+def cosine_rows(a, b):
+    a = np.asarray(a, dtype="float32")
+    b = np.asarray(b, dtype="float32")
+    num = (a * b).sum(axis=1)
+    return num / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1) + 1e-10)
+
+
+def _model_dir(model_name: str, onnx_dir: str):
+    return os.path.join(onnx_dir, model_name.replace("/", "__"))
+
+
+def _model_file(variant: str):
+    return "model.int8.onnx" if variant == "int8" else "model.onnx"
+
+
+def _read_report(model_dir: str):
+    path = os.path.join(model_dir, "export_report.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def export(model_name: str, onnx_dir: str = ONNX_DIR, quantize: bool = False):
+    """
+    Export `model_name` (and optionally its int8 version) and verify it.
+    Returns the export report; raises ValueError when the exported model
+    falls outside COSINE_TOLERANCE, in which case that model is not kept.
+    """
+    final_dir = _model_dir(model_name, onnx_dir)
+    out_dir = f"{final_dir}.tmp{os.getpid()}"
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    try:
+        report = _export_into(model_name, out_dir, quantize)
+        _install(out_dir, final_dir, report)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    failed = [v for v in ("fp32", "int8") if v in report and not report[v]["ok"]]
+    if failed:
+        raise ValueError(f"ONNX export of {model_name} outside cosine tolerance: {failed} ({report})")
+    return report
+
+
+def _export_into(model_name: str, out_dir: str, quantize: bool):
+    """Write the ONNX model(s), tokenizer and encoder.json to out_dir; returns the verification report."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0]
+    tokenizer = transformer.tokenizer
+    module_names = [type(m).__name__ for m in st_model]
+    pooling = st_model[1].get_pooling_mode_str() if len(st_model) > 1 and module_names[1] == "Pooling" else "mean"
+
+    sample = tokenizer(["hello world"], padding=True, return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+
+    class _LastHiddenState(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs)))[0]
+
+    model_path = os.path.join(out_dir, "model.onnx")
+    # TorchScript exporter: newer torch defaults to the dynamo one, which needs onnxscript and
+    # treats dynamic_axes differently; older torch has no `dynamo` argument and only this exporter
+    exporter = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    with torch.no_grad():
+        torch.onnx.export(
+            _LastHiddenState(transformer.auto_model.eval()),
+            tuple(sample[n] for n in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={n: {0: "batch", 1: "sequence"} for n in input_names + ["last_hidden_state"]},
+            opset_version=OPSET,
+            do_constant_folding=True,
+            **exporter,
+        )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(model_path, os.path.join(out_dir, "model.int8.onnx"), weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(out_dir)
+    spec = {
+        "model_name": model_name,
+        "input_names": input_names,
+        "pooling": pooling,
+        "normalize": "Normalize" in module_names,
+        "max_seq_length": transformer.max_seq_length,
+        "dim": st_model.get_sentence_embedding_dimension(),
+    }
+    with open(os.path.join(out_dir, "encoder.json"), "w") as f:
+        json.dump(spec, f, indent=2)
+
+    # verify against the PyTorch path while its model is loaded anyway
+    reference = st_model.encode(PROBE_SENTENCES, convert_to_numpy=True)
+    report = {"model_name": model_name, "probes": len(PROBE_SENTENCES)}
+    for variant in (["fp32", "int8"] if quantize else ["fp32"]):
+        encoder = OnnxEncoder(model_name, quantized=variant == "int8", model_dir=out_dir)
+        sims = cosine_rows(encoder.encode(PROBE_SENTENCES), reference)
+        report[variant] = {"min_cosine": float(sims.min()), "mean_cosine": float(sims.mean()),
+                           "tolerance": COSINE_TOLERANCE[variant], "ok": bool(sims.min() >= COSINE_TOLERANCE[variant])}
+    return report
+
+
+def _install(out_dir: str, final_dir: str, report: dict):
+    """
+    Move the export into final_dir: support files first, then the model of
+    each variant that passed, each with an atomic rename, so a model file
+    is only ever present next to the tokenizer and spec it was checked with.
+    The report (failures included) is merged into the existing one.
+    """
+    os.makedirs(final_dir, exist_ok=True)
+    model_files = {_model_file(v) for v in ("fp32", "int8")}
+    for name in os.listdir(out_dir):
+        if name not in model_files:
+            os.replace(os.path.join(out_dir, name), os.path.join(final_dir, name))
+    merged = {**_read_report(final_dir), **report}
+    tmp_path = os.path.join(final_dir, "export_report.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(merged, f, indent=2)
+    os.replace(tmp_path, os.path.join(final_dir, "export_report.json"))
+    for variant in ("fp32", "int8"):
+        if variant in report and report[variant]["ok"]:
+            os.replace(os.path.join(out_dir, _model_file(variant)), os.path.join(final_dir, _model_file(variant)))
+
+
+class OnnxEncoder:
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", onnx_dir: str = ONNX_DIR,
+                 quantized: bool = False, threads: int = None, model_dir: str = None):
+        # model_dir: load an export from this directory as-is (used to verify a fresh export)
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        variant = "int8" if quantized else "fp32"
+        model_file = _model_file(variant)
+        if model_dir is None:
+            model_dir = _model_dir(model_name, onnx_dir)
+            checked = _read_report(model_dir).get(variant)
+            if checked is not None and not checked["ok"]:
+                raise ValueError(f"ONNX {variant} export of {model_name} failed its cosine check "
+                                 f"({checked}); delete {model_dir} to export again")
+            if not os.path.exists(os.path.join(model_dir, model_file)):
+                print(f"Exporting {model_name} to ONNX ({variant})")
+                export(model_name, onnx_dir, quantize=quantized)
+        self.model_dir = model_dir
+
+        with open(os.path.join(self.model_dir, "encoder.json"), "r") as f:
+            self.spec = json.load(f)
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = int(threads)
+        self.session = ort.InferenceSession(
+            os.path.join(self.model_dir, model_file), options, providers=["CPUExecutionProvider"],
+        )
+        self.quantized = quantized
+
+    def get_sentence_embedding_dimension(self):
+        return self.spec["dim"]
+
+    def _encode_batch(self, texts: list):
+        enc = self.tokenizer(texts, padding=True, truncation=True,
+                             max_length=self.spec["max_seq_length"], return_tensors="np")
+        feeds = {n: enc[n].astype("int64") for n in self.spec["input_names"]}
+        hidden = self.session.run(None, feeds)[0]
+        if self.spec["pooling"] == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = feeds["attention_mask"][..., None].astype("float32")
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.spec["normalize"]:
+            pooled = pooled / (np.linalg.norm(pooled, axis=1, keepdims=True) + 1e-12)
+        return pooled.astype("float32")
+
+    def encode(self, texts, convert_to_numpy=True, batch_size=32, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        if not texts:
+            return np.zeros((0, self.spec["dim"]), dtype="float32")
+        # like SentenceTransformer: batch texts of similar length to keep padding small
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        out = np.empty((len(texts), self.spec["dim"]), dtype="float32")
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            out[idx] = self._encode_batch([texts[i] for i in idx])
+        return out[0] if single else out
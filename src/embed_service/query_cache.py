@@ -0,0 +1,53 @@
+# src/embed_service/query_cache.py
+import time
+import threading
+from collections import OrderedDict
+
+from src.common.text import normalize_query
+
+
+class QueryCache:
+    """
+    In-memory LRU for query embeddings, bounded by entry count and age.
+    Lives only in the embed service process; nothing is written to disk.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # normalized query -> (timestamp, embedding)
+        self._lock = threading.Lock()
+
+    def get(self, query: str):
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl <= 0 or time.time() - entry[0] <= self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, query: str, embedding):
+        key = normalize_query(query)
+        with self._lock:
+            self._entries[key] = (time.time(), embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,131 @@
+# src/embed_service/vector_store.py
+import os
+import json
+import threading
+import numpy as np
+
+DEFAULT_DIM = 384
+INITIAL_CAPACITY = 1024
+
+
+class MmapVectorStore:
+    """
+    Append-only float32 matrix backed by a memory-mapped .npy file.
+
+    The file is preallocated to `capacity` rows and doubled when it fills up,
+    so appends write in place instead of copying the whole matrix. Only the
+    first `count` rows are live; `count` is kept in a small JSON header that
+    is rewritten on flush(), so rows appended after the last flush are
+    ignored on the next start.
+
+    Sync endpoints call it from FastAPI's thread pool, so every method
+    holds a lock: concurrent appends get distinct rows and readers never
+    see the mapping mid-swap while the file grows.
+    """
+
+    def __init__(self, path: str, header_path: str, dim: int = DEFAULT_DIM,
+                 initial_capacity: int = INITIAL_CAPACITY):
+        self.path = path
+        self.header_path = header_path
+        self.dim = dim
+        self.initial_capacity = initial_capacity
+        self.count = 0
+        self.rows = None  # np.memmap of shape (capacity, dim)
+        self._lock = threading.RLock()
+
+        if os.path.exists(self.path):
+            # map instead of np.load so large caches open without reading them
+            self.rows = np.load(self.path, mmap_mode="r+")
+            self.dim = self.rows.shape[1]
+            if os.path.exists(self.header_path):
+                with open(self.header_path, "r") as f:
+                    self.count = int(json.load(f)["count"])
+            else:
+                # file written by np.save (older caches): every row is live
+                self.count = self.rows.shape[0]
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def capacity(self) -> int:
+        return 0 if self.rows is None else self.rows.shape[0]
+
+    def view(self):
+        with self._lock:
+            if self.rows is None:
+                return np.zeros((0, self.dim), dtype="float32")
+            return self.rows[:self.count]
+
+    def get(self, idx: int):
+        with self._lock:
+            return self.rows[idx]
+
+    def _allocate(self, capacity: int):
+        tmp_path = self.path + ".tmp"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype="float32", shape=(capacity, self.dim))
+        if self.count:
+            grown[:self.count] = self.rows[:self.count]
+        grown.flush()
+        del grown
+        self.rows = None
+        os.replace(tmp_path, self.path)
+        self.rows = np.load(self.path, mmap_mode="r+")
+
+    def append(self, vectors) -> int:
+        """Append rows and return the index of the first one."""
+        with self._lock:
+            vectors = np.asarray(vectors, dtype="float32")
+            if self.rows is None and self.count == 0:
+                self.dim = vectors.shape[-1]
+            vectors = vectors.reshape(-1, self.dim)
+
+            start = self.count
+            needed = start + vectors.shape[0]
+            if needed > self.capacity:
+                new_capacity = max(self.capacity, self.initial_capacity)
+                while new_capacity < needed:
+                    new_capacity *= 2
+                self._allocate(new_capacity)
+
+            self.rows[start:needed] = vectors
+            self.count = needed
+            return start
+
+    def write_compacted(self, path: str, keep, chunk_rows: int = 8192):
+        """
+        Write the rows listed in `keep`, in that order, to a new file at
+        `path` (row keep[i] becomes row i); this store keeps serving its own
+        file until switch(). Rows are copied in chunks, so live data is never
+        held in memory at once.
+        """
+        with self._lock:
+            keep = np.asarray(keep, dtype="int64")
+            capacity = self.initial_capacity
+            while capacity < len(keep):
+                capacity *= 2
+            tmp_path = path + ".tmp"
+            packed = np.lib.format.open_memmap(tmp_path, mode="w+", dtype="float32", shape=(capacity, self.dim))
+            for start in range(0, len(keep), chunk_rows):
+                part = keep[start:start + chunk_rows]
+                packed[start:start + len(part)] = self.rows[part]
+            packed.flush()
+            del packed
+            os.replace(tmp_path, path)
+
+    def switch(self, path: str, count: int):
+        """Serve `path` (written by write_compacted) with `count` live rows from now on."""
+        with self._lock:
+            self.rows = np.load(path, mmap_mode="r+")
+            self.path = path
+            self.count = count
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self.rows is not None:
+                self.rows.flush()
+            tmp_path = self.header_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"count": self.count, "dim": self.dim}, f)
+            os.replace(tmp_path, self.header_path)
@@ -1,16 +1,89 @@
 # src/explain_service/app.py
-from fastapi import FastAPI
+from typing import List, Optional
+from fastapi import FastAPI, Response
 from pydantic import BaseModel
+from src.common import metrics
+from src.common.text import content_hash
 from src.explain_service.explainer import Explainer
+from src.explain_service.result_cache import ExplanationCache
 
+import os
 
-app = FastAPI(title="Explain Service")
+
+app = metrics.instrument(FastAPI(title="Explain Service"), "explain")
 explainer = Explainer()
+# (query, document hash) -> explanation; set EXPLAIN_CACHE_PATH="" to keep it in memory only
+result_cache = ExplanationCache(
+    max_size=int(os.environ.get("EXPLAIN_CACHE_SIZE", "2048")),
+    path=os.environ.get("EXPLAIN_CACHE_PATH", "cache/explain_cache.jsonl") or None,
+)
+metrics.REGISTRY.gauge("explain_cache_hit_ratio", "Explanation cache hit ratio", fn=lambda: result_cache.stats()["hit_ratio"])
+metrics.REGISTRY.gauge("explain_cache_entries", "Explanations held in the cache", fn=lambda: result_cache.stats()["size"])
+
+def _cacheable(result: dict) -> bool:
+    # a missing LLM answer while the client is configured means the call failed; retry next time
+    return explainer.client is None or result.get("llm_explanation") is not None
 
 class ExplainRequest(BaseModel):
     query: str
     document_text: str
+    doc_hash: Optional[str] = None
 
 @app.post("/explain")
 def explain_doc(req: ExplainRequest):
-    return explainer.explain(req.query, req.document_text)
+    doc_hash = req.doc_hash or content_hash(req.document_text)
+    cached = result_cache.get(req.query, doc_hash)
+    if cached is not None:
+        return cached
+    result = explainer.explain(req.query, req.document_text, doc_hash=doc_hash)
+    if _cacheable(result):
+        result_cache.put(req.query, doc_hash, result)
+    return result
+
+class ExplainBatchRequest(BaseModel):
+    query: str
+    documents: List[str]
+    # content hashes aligned with documents; lets stored sentence embeddings be reused
+    hashes: Optional[List[str]] = None
+
+@app.post("/explain_batch")
+def explain_batch(req: ExplainBatchRequest, response: Response):
+    if req.hashes is not None and len(req.hashes) != len(req.documents):
+        # misaligned hashes would serve (and cache) one document's explanation for another
+        response.status_code = 422
+        return {"error": "hashes_mismatch",
+                "message": f"{len(req.hashes)} hashes for {len(req.documents)} documents"}
+    hashes = req.hashes or [content_hash(doc) for doc in req.documents]
+    explanations = [result_cache.get(req.query, h) for h in hashes]
+
+    # only documents without a cached explanation go through the model / LLM
+    misses = [i for i, e in enumerate(explanations) if e is None]
+    if misses:
+        fresh = explainer.explain_batch(
+            req.query,
+            [req.documents[i] for i in misses],
+            hashes=[hashes[i] for i in misses],
+        )
+        for i, result in zip(misses, fresh):
+            explanations[i] = result
+            if _cacheable(result):
+                result_cache.put(req.query, hashes[i], result)
+
+    return {"explanations": explanations}
+
+@app.get("/ready")
+def ready():
+    return {"ready": True, "llm_configured": explainer.client is not None}
+
+@app.get("/cache_stats")
+def cache_stats():
+    return result_cache.stats()
+
+class IndexSentencesRequest(BaseModel):
+    docs: list  # [{hash, text}]
+
+@app.post("/index_sentences")
+def index_sentences(req: IndexSentencesRequest):
+    docs = [(d["hash"], d.get("text") or d.get("clean_text") or "") for d in req.docs]
+    indexed = explainer.index_sentences(docs)
+    return {"count": len(docs), "indexed": indexed, "cached": len(docs) - indexed}
@@ -2,18 +2,27 @@
 
 import re
 import numpy as np
-from sentence_transformers import SentenceTransformer
+from concurrent.futures import ThreadPoolExecutor
 from google import genai
 import os
+from src.common.metrics import stage
+from src.common.models import load_sentence_model
+from src.explain_service.sentence_store import SentenceStore
 STOPWORDS = set("""
 a an the and or but if while with without for on in into by to from of is are was were be been being as it this that these those
 """.split())
 
+# max concurrent Gemini calls for one explain_batch request
+LLM_WORKERS = int(os.environ.get("EXPLAIN_LLM_WORKERS", "8"))
+
 
 class Explainer:
-    def __init__(self):
-        # Sentence transformer for similarity scoring
-        self.model = SentenceTransformer("all-MiniLM-L6-v2")
+    def __init__(self, model=None, sentence_store=None):
+        # Sentence transformer for similarity scoring (any object with a compatible encode());
+        # by default the same process-wide instance the Embedder uses
+        self.model = model if model is not None else load_sentence_model("all-MiniLM-L6-v2")[0]
+        # sentence splits + embeddings precomputed at ingest, keyed by document hash
+        self.sentence_store = sentence_store if sentence_store is not None else SentenceStore()
 
         # Load Gemini API key from environment
         api_key = os.environ.get("GENAI_API_KEY")
@@ -49,30 +58,81 @@ class Explainer:
         return list(overlap), float(overlap_ratio)
 
     # ---------------------------
-    # BEST SENTENCES MATCHING QUERY
+    # SENTENCE SPLITTING
     # ---------------------------
-    def best_sentences(self, query: str, doc: str, top_k=2):
+    def split_sentences(self, doc: str):
         sentences = re.split(r"[.!?]", doc)
-        sentences = [s.strip() for s in sentences if len(s.strip()) > 0]
-
-        if len(sentences) == 0:
-            return []
+        return [s.strip() for s in sentences if len(s.strip()) > 0]
 
-        q_emb = self.model.encode(query, convert_to_numpy=True)
-        s_embs = self.model.encode(sentences, convert_to_numpy=True)
+    def _encode_normalized(self, texts: list):
+        embs = self.model.encode(texts, convert_to_numpy=True)
+        return embs / (np.linalg.norm(embs, axis=1, keepdims=True) + 1e-10)
 
-        q_emb = q_emb / (np.linalg.norm(q_emb) + 1e-10)
-        s_norm = s_embs / (np.linalg.norm(s_embs, axis=1, keepdims=True) + 1e-10)
+    # ---------------------------
+    # INGEST-TIME SENTENCE INDEXING
+    # ---------------------------
+    def index_sentences(self, docs: list):
+        """
+        docs: list of (hash, text). Splits and embeds every document whose
+        hash is not stored yet, all in one encode call. Returns how many
+        documents were newly indexed.
+        """
+        pending = [(h, self.split_sentences(text)) for h, text in docs if not self.sentence_store.has(h)]
+        flat = [s for _, sentences in pending for s in sentences]
+        with stage("sentence_encode"):
+            embs = self._encode_normalized(flat) if flat else np.zeros((0, 0), dtype="float32")
+
+        offset = 0
+        for h, sentences in pending:
+            self.sentence_store.put(h, sentences, embs[offset:offset + len(sentences)])
+            offset += len(sentences)
+        return len(pending)
 
-        sims = (s_norm @ q_emb).tolist()
-        top_ids = np.argsort(sims)[::-1][:top_k]
+    # ---------------------------
+    # BEST SENTENCES MATCHING QUERY
+    # ---------------------------
+    def best_sentences(self, query: str, doc: str, top_k=2, doc_hash=None):
+        return self.best_sentences_batch(query, [doc], top_k=top_k, hashes=[doc_hash])[0]
+
+    def best_sentences_batch(self, query: str, docs: list, top_k=2, hashes=None):
+        """
+        Score the sentences of several documents against one query. Documents
+        whose hash is in the sentence store reuse their stored matrix; the rest
+        are split and encoded together with the query in a single call.
+        """
+        hashes = hashes or [None] * len(docs)
+        per_doc = [None] * len(docs)  # (sentences, normalized embeddings)
+        pending = []
+        for i, h in enumerate(hashes):
+            stored = self.sentence_store.get(h) if h else None
+            if stored is not None:
+                per_doc[i] = stored
+            else:
+                pending.append((i, self.split_sentences(docs[i])))
+
+        flat = [s for _, sentences in pending for s in sentences]
+        embs = self._encode_normalized([query] + flat)
+        q_emb = embs[0]
+
+        offset = 1
+        for i, sentences in pending:
+            doc_embs = embs[offset:offset + len(sentences)]
+            offset += len(sentences)
+            per_doc[i] = (sentences, doc_embs)
+            if hashes[i] and sentences:
+                self.sentence_store.put(hashes[i], sentences, doc_embs)
 
         results = []
-        for idx in top_ids:
-            results.append({
-                "sentence": sentences[idx],
-                "score": float(sims[idx])
-            })
+        for sentences, doc_embs in per_doc:
+            if len(sentences) == 0:
+                results.append([])
+                continue
+            doc_sims = doc_embs @ q_emb
+            top_ids = np.argsort(doc_sims)[::-1][:top_k]
+            results.append([
+                {"sentence": sentences[idx], "score": float(doc_sims[idx])}
+                for idx in top_ids
+            ])
 
         return results
 
@@ -80,6 +140,8 @@ class Explainer:
     # LLM-LEVEL EXPLANATION
     # ---------------------------
     def llm_explain(self, query, doc_text, top_sentences):
+        if self.client is None:
+            return None
 
         formatted_sentences = "\n".join(
             [f"- {s['sentence']} (score: {s['score']:.2f})" for s in top_sentences]
@@ -108,14 +170,23 @@ Write 2–3 natural sentences explaining WHY this document is relevant.
 
         return response.text.strip()
 
+    def _llm_explain_or_none(self, query, doc_text, top_sentences):
+        # one failed Gemini call should not sink the other results of a batch
+        try:
+            return self.llm_explain(query, doc_text, top_sentences)
+        except Exception:
+            return None
+
     # ---------------------------
     # MAIN EXPLAIN FUNCTION
     # ---------------------------
-    def explain(self, query: str, doc_text: str):
+    def explain(self, query: str, doc_text: str, doc_hash=None):
 
         keywords, overlap_ratio = self.keyword_overlap(query, doc_text)
-        top_sents = self.best_sentences(query, doc_text)
-        llm_summary = self.llm_explain(query, doc_text, top_sents)
+        with stage("sentence_scoring"):
+            top_sents = self.best_sentences(query, doc_text, doc_hash=doc_hash)
+        with stage("llm"):
+            llm_summary = self.llm_explain(query, doc_text, top_sents)
 
         return {
             "keyword_overlap": keywords,
@@ -123,3 +194,25 @@ Write 2–3 natural sentences explaining WHY this document is relevant.
             "top_sentences": top_sents,
             "llm_explanation": llm_summary
         }
+
+    def explain_batch(self, query: str, docs: list, hashes=None):
+        keyword_parts = [self.keyword_overlap(query, doc) for doc in docs]
+        with stage("sentence_scoring"):
+            top_sents = self.best_sentences_batch(query, docs, hashes=hashes)
+
+        # LLM calls are network-bound, so issue them side by side
+        if self.client is not None and docs:
+            with stage("llm"), ThreadPoolExecutor(max_workers=min(len(docs), LLM_WORKERS)) as pool:
+                llm_summaries = list(pool.map(self._llm_explain_or_none, [query] * len(docs), docs, top_sents))
+        else:
+            llm_summaries = [None] * len(docs)
+
+        return [
+            {
+                "keyword_overlap": keywords,
+                "overlap_ratio": overlap_ratio,
+                "top_sentences": sents,
+                "llm_explanation": summary
+            }
+            for (keywords, overlap_ratio), sents, summary in zip(keyword_parts, top_sents, llm_summaries)
+        ]
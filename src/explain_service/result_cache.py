@@ -0,0 +1,95 @@
+# src/explain_service/result_cache.py
+import os
+import json
+import threading
+from collections import OrderedDict
+
+from src.common.text import normalize_query
+
+
+class ExplanationCache:
+    """
+    LRU of explain results keyed by (normalized query, document hash).
+
+    With a `path`, every insert is appended to a JSONL log and the log is
+    replayed on startup, so explanations (and the LLM calls behind them)
+    survive restarts. The log is rewritten with only the live entries when
+    it grows past a few times max_size.
+    """
+
+    def __init__(self, max_size: int = 2048, path: str = None):
+        self.max_size = max_size
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> explanation dict
+        self._lock = threading.Lock()
+        self._log_lines = 0
+
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._load()
+
+    def _key(self, query: str, doc_hash: str) -> str:
+        return f"{doc_hash}:{normalize_query(query)}"
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from an interrupted write
+                self._entries[record["key"]] = record["value"]
+                self._entries.move_to_end(record["key"])
+                self._log_lines += 1
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        if self._log_lines > 2 * len(self._entries):
+            self._rewrite_log()
+
+    def _rewrite_log(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for key, value in self._entries.items():
+                f.write(json.dumps({"key": key, "value": value}) + "\n")
+        os.replace(tmp_path, self.path)
+        self._log_lines = len(self._entries)
+
+    def get(self, query: str, doc_hash: str):
+        key = self._key(query, doc_hash)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, query: str, doc_hash: str, value: dict):
+        key = self._key(query, doc_hash)
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            if self.path:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps({"key": key, "value": value}) + "\n")
+                self._log_lines += 1
+                if self._log_lines > 4 * self.max_size:
+                    self._rewrite_log()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "persistent": bool(self.path),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
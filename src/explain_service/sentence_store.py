@@ -0,0 +1,71 @@
+# src/explain_service/sentence_store.py
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+SENTENCE_DIR = "cache/sentences"
+# entries kept decoded in memory; older ones are re-read from disk on demand
+LOADED_ENTRIES = int(os.environ.get("SENTENCE_STORE_LOADED", "1024"))
+
+_HEX_DIGEST = re.compile(r"[0-9a-f]{32,128}")
+
+
+class SentenceStore:
+    """
+    Per-document sentence segmentation + normalized sentence embeddings,
+    keyed by document content hash. Each entry is two files:
+    {hash}.json (sentences) and {hash}.npy (float32 matrix, one row per sentence).
+    Hashes come from clients, so anything but a hex digest is itself hashed
+    before it becomes a file name.
+    """
+
+    def __init__(self, store_dir: str = SENTENCE_DIR, max_loaded: int = LOADED_ENTRIES):
+        self.store_dir = store_dir
+        self.max_loaded = max_loaded
+        os.makedirs(store_dir, exist_ok=True)
+        self._loaded = OrderedDict()  # hash -> (sentences, embeddings), least recently used first
+        self._lock = threading.Lock()
+
+    def _paths(self, doc_hash: str):
+        name = doc_hash if _HEX_DIGEST.fullmatch(doc_hash) else hashlib.sha256(doc_hash.encode("utf-8")).hexdigest()
+        base = os.path.join(self.store_dir, name)
+        return base + ".json", base + ".npy"
+
+    def _remember(self, doc_hash: str, entry):
+        with self._lock:
+            self._loaded[doc_hash] = entry
+            self._loaded.move_to_end(doc_hash)
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+
+    def has(self, doc_hash: str) -> bool:
+        return doc_hash in self._loaded or os.path.exists(self._paths(doc_hash)[1])
+
+    def get(self, doc_hash: str):
+        with self._lock:
+            entry = self._loaded.get(doc_hash)
+            if entry is not None:
+                self._loaded.move_to_end(doc_hash)
+                return entry
+        sent_path, emb_path = self._paths(doc_hash)
+        if not os.path.exists(emb_path):
+            return None
+        with open(sent_path, "r") as f:
+            sentences = json.load(f)
+        entry = (sentences, np.load(emb_path))
+        self._remember(doc_hash, entry)
+        return entry
+
+    def put(self, doc_hash: str, sentences: list, embeddings):
+        sent_path, emb_path = self._paths(doc_hash)
+        embeddings = np.asarray(embeddings, dtype="float32")
+        with open(sent_path, "w") as f:
+            json.dump(sentences, f)
+        # the .npy is written last, so has() only sees complete entries
+        np.save(emb_path + ".tmp.npy", embeddings)
+        os.replace(emb_path + ".tmp.npy", emb_path)
+        self._remember(doc_hash, (sentences, embeddings))
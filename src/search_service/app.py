@@ -1,34 +1,147 @@
 # src/search_service/app.py
+from typing import Optional, Union
 from fastapi import FastAPI
 from pydantic import BaseModel
-from src.search_service.indexer import FAISSIndexer
+from src.common import metrics, wire
+from src.search_service.indexer import FAISSIndexer, RebuildRequired
 
-import numpy as np
 
-app = FastAPI(title="Search Service")
+app = metrics.instrument(FastAPI(title="Search Service"), "search")
 
 indexer = FAISSIndexer()
 # attempt load if exists
 indexer.try_load()
+metrics.REGISTRY.gauge("index_vectors", "Vectors in the FAISS index", fn=lambda: 0 if indexer.index is None else indexer.index.ntotal)
 
 class BuildIndexRequest(BaseModel):
-    embeddings: list
+    # embedding fields take a JSON list of lists or a packed matrix (src/common/wire.py)
+    embeddings: Union[list, dict]
     meta: dict
+    # index_type (flat | ivf_flat | ivf_pq | hnsw) and its parameters; unset keys use DEFAULT_CONFIG
+    config: Optional[dict] = None
+    # filename -> content hash, so later /initialize runs can send only changed documents
+    hashes: Optional[dict] = None
+    # character offset of each row's chunk within its document (aligned with embeddings)
+    offsets: Optional[list] = None
 
 @app.post("/build_index")
 def build_index(req: BuildIndexRequest):
-    embeddings = np.array(req.embeddings, dtype="float32")
-    indexer.build(embeddings, req.meta)
-    return {"status": "index_built", "count": embeddings.shape[0]}
+    embeddings = wire.decode_matrix(req.embeddings)
+    try:
+        with metrics.stage("index_build"):
+            report = indexer.build(embeddings, req.meta, req.config, hashes=req.hashes, offsets=req.offsets)
+    except ValueError as e:
+        return {"error": "invalid_index_config", "message": str(e)}
+    return {"status": "index_built", "count": embeddings.shape[0], "config": indexer.config, "report": report}
+
+@app.get("/index_info")
+def index_info():
+    count = 0 if indexer.index is None else indexer.index.ntotal
+    return {"count": count, "config": indexer.config, "report": indexer.report, "mapped": indexer.mapped}
+
+@app.get("/index_state")
+def index_state(include_hashes: bool = True):
+    # include_hashes=false: just the corpus fingerprint, for the /initialize fast path
+    if indexer.index is None:
+        return {"built": False, "incremental": False, "chunked": False, "fingerprint": None, "hashes": {}}
+    state = {"built": True, "incremental": indexer.incremental, "chunked": indexer.chunked,
+             "fingerprint": indexer.fingerprint}
+    if include_hashes:
+        state["hashes"] = indexer.hashes
+    return state
+
+@app.get("/ready")
+def ready():
+    # the service can take /build_index without an index, so it is ready once imported
+    return {
+        "ready": True,
+        "index_loaded": indexer.index is not None,
+        "vectors": 0 if indexer.index is None else indexer.index.ntotal,
+        "mapped": indexer.mapped,
+        "fingerprint": indexer.fingerprint,
+    }
+
+class UpsertRequest(BaseModel):
+    # one entry per vector: a chunked document repeats its filename and hash
+    embeddings: Union[list, dict]
+    filenames: list
+    hashes: list
+    offsets: Optional[list] = None
+
+@app.post("/upsert_vectors")
+def upsert_vectors(req: UpsertRequest):
+    if indexer.index is None:
+        return {"error": "index_not_built"}
+    if not req.filenames:
+        return {"updated": 0, "added": 0, "vectors": 0}
+    try:
+        with metrics.stage("index_upsert"):
+            return indexer.upsert(wire.decode_matrix(req.embeddings), req.filenames, req.hashes, req.offsets)
+    except RebuildRequired as e:
+        return {"error": "rebuild_required", "message": str(e)}
+
+class DeleteRequest(BaseModel):
+    filenames: list
+
+@app.post("/delete_vectors")
+def delete_vectors(req: DeleteRequest):
+    if indexer.index is None:
+        return {"error": "index_not_built"}
+    try:
+        return indexer.delete(req.filenames)
+    except RebuildRequired as e:
+        return {"error": "rebuild_required", "message": str(e)}
 
 class SearchRequest(BaseModel):
-    query_embedding: list
+    query_embedding: Union[list, dict]
     top_k: int = 5
+    # how chunk hits are pooled into document scores: "max" (best chunk) or "sum"
+    pooling: str = "max"
+    # per-request overrides of the index's default search-time parameters
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
 
 @app.post("/search_vectors")
 def search_vectors(req: SearchRequest):
     if indexer.index is None:
         return {"error": "index_not_built"}
-    query = np.array(req.query_embedding, dtype="float32")
-    scores, ids = indexer.search(query, req.top_k)
-    return {"scores": scores, "ids": ids, "meta": indexer.meta}
+    query = wire.decode_matrix(req.query_embedding)
+    try:
+        with metrics.stage("faiss_search"):
+            hits = indexer.search_documents(query, req.top_k, pooling=req.pooling, nprobe=req.nprobe, ef_search=req.ef_search)
+    except ValueError as e:
+        return {"error": "invalid_search_request", "message": str(e)}
+    return _hits_response(hits)
+
+def _hits_response(hits: list):
+    # documents are resolved here instead of shipping the whole id -> filename map with every query
+    return {
+        "scores": [h["score"] for h in hits],
+        "pooled_scores": [h["pooled"] for h in hits],
+        "ids": [h["id"] for h in hits],
+        "filenames": [h["filename"] for h in hits],
+        "offsets": [h["offset"] for h in hits],
+    }
+
+class BatchSearchRequest(BaseModel):
+    # (N, dim): list of lists or a packed matrix
+    query_embeddings: Union[list, dict]
+    top_k: int = 5
+    pooling: str = "max"
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+
+@app.post("/search_vectors_batch")
+def search_vectors_batch(req: BatchSearchRequest):
+    if indexer.index is None:
+        return {"error": "index_not_built"}
+    queries = wire.decode_matrix(req.query_embeddings)
+    if queries.shape[0] == 0:
+        return {"results": []}
+    try:
+        with metrics.stage("faiss_search"):
+            hits = indexer.search_documents_batch(queries, req.top_k, pooling=req.pooling, nprobe=req.nprobe, ef_search=req.ef_search)
+    except ValueError as e:
+        return {"error": "invalid_search_request", "message": str(e)}
+    # results[i] has the same shape as a /search_vectors response for query i
+    return {"results": [_hits_response(h) for h in hits]}
@@ -2,47 +2,402 @@
 import numpy as np
 import faiss
 import os
+import json
 import pickle
+import threading
+import time
+
+from src.common import corpus
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+# vector storage of flat / ivf_flat / hnsw indexes (ivf_pq always stores PQ codes)
+STORAGE_TYPES = ("float32", "float16", "sq8")
+_SQ_TYPES = {"float16": faiss.ScalarQuantizer.QT_fp16, "sq8": faiss.ScalarQuantizer.QT_8bit}
+
+# FAISS_MMAP=1 opens persisted indexes memory-mapped, so worker processes share the page cache
+MMAP = os.environ.get("FAISS_MMAP", "0") == "1"
+MMAP_FLAG = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+DEFAULT_CONFIG = {
+    "index_type": os.environ.get("FAISS_INDEX_TYPE", "flat"),
+    "nlist": 100,          # IVF: number of coarse clusters
+    "pq_m": 16,            # IVF-PQ: sub-quantizers (must divide dim)
+    "pq_nbits": 8,         # IVF-PQ: bits per sub-quantizer code
+    "hnsw_m": 32,          # HNSW: graph degree
+    "ef_construction": 40, # HNSW: build-time beam width
+    "nprobe": 8,           # IVF: default clusters visited per query
+    "ef_search": 64,       # HNSW: default search beam width
+    "storage": os.environ.get("FAISS_STORAGE", "float32"),  # float32 | float16 | sq8 (8-bit scalar quantizer)
+    "min_recall": float(os.environ.get("FAISS_MIN_RECALL", "0")),  # builds below this recall@k are rejected
+}
+
+RECALL_SAMPLE = 100
+RECALL_K = 10
+# chunk hits fetched per requested document before pooling chunks back to documents
+CHUNK_OVERFETCH = 4
+POOLING = ("max", "sum")
+
+
+def make_index(dim: int, n: int, config: dict):
+    """
+    Build an untrained FAISS index for `config`. Parameters that the corpus
+    size cannot support (more IVF lists than vectors, PQ codebooks larger
+    than the training set) are clamped; the returned config records the
+    values actually used.
+    """
+    config = dict(config)
+    index_type = config["index_type"]
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"unknown index_type {index_type!r}, expected one of {INDEX_TYPES}")
+    storage = config["storage"]
+    if storage not in STORAGE_TYPES:
+        raise ValueError(f"unknown storage {storage!r}, expected one of {STORAGE_TYPES}")
+    qtype = _SQ_TYPES.get(storage)
+
+    if index_type == "flat":
+        if qtype is not None:
+            return faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_L2), config
+        return faiss.IndexFlatL2(dim), config
+
+    if index_type == "hnsw":
+        if qtype is not None:
+            index = faiss.IndexHNSWSQ(dim, qtype, int(config["hnsw_m"]))
+        else:
+            index = faiss.IndexHNSWFlat(dim, int(config["hnsw_m"]))
+        index.hnsw.efConstruction = int(config["ef_construction"])
+        return index, config
+
+    # IVF variants: FAISS wants ~39 training points per list (and per PQ centroid)
+    config["nlist"] = max(1, min(int(config["nlist"]), n // 39))
+    quantizer = faiss.IndexFlatL2(dim)
+    if index_type == "ivf_flat":
+        if qtype is not None:
+            return faiss.IndexIVFScalarQuantizer(quantizer, dim, config["nlist"], qtype, faiss.METRIC_L2), config
+        return faiss.IndexIVFFlat(quantizer, dim, config["nlist"], faiss.METRIC_L2), config
+
+    config["storage"] = "pq"
+    m = int(config["pq_m"])
+    while dim % m != 0:
+        m -= 1
+    nbits = max(1, min(int(config["pq_nbits"]), int(np.log2(max(n // 39, 2)))))
+    config["pq_m"], config["pq_nbits"] = m, nbits
+    return faiss.IndexIVFPQ(quantizer, dim, config["nlist"], m, nbits), config
+
+
+class RebuildRequired(Exception):
+    """The requested incremental update is not possible on the current index; rebuild instead."""
+
 
 class FAISSIndexer:
     def __init__(self):
         self.index = None
-        self.meta = None
+        self.meta = None      # str(vector id) -> filename of the document the vector belongs to
+        self.offsets = {}     # str(vector id) -> character offset of its chunk in clean_text
+        self.chunked = False
+        self.doc_ids = {}     # filename -> [vector ids]
+        self.hashes = {}      # filename -> content hash of the indexed document
+        self.fingerprint = None  # corpus fingerprint of `hashes`, saved with the index
+        self.next_id = 0
+        self.stable_ids = False  # vector ids survive upserts/deletes (False: legacy positional index)
+        self.config = dict(DEFAULT_CONFIG)
+        self.report = None
+        self.mmap = MMAP
+        self.mapped = False  # index is a read-only memory map of index_path
         self.index_path = "faiss_index.bin"
         self.meta_path = "faiss_meta.pkl"
+        self.config_path = "faiss_config.json"
+        # search-time parameters live on the index object, so set + search must not interleave
+        self._lock = threading.Lock()
 
     def try_load(self):
         if not os.path.exists(self.meta_path) or not os.path.exists(self.index_path):
             return None, None
         with open(self.meta_path, "rb") as f:
-            meta = pickle.load(f)
-        index = faiss.read_index(self.index_path)
+            saved_meta = pickle.load(f)
+        # indexes saved before chunking hold one whole-document vector per file
+        self.chunked = "offsets" in saved_meta
+        self.stable_ids = "next_id" in saved_meta
+        if "next_id" in saved_meta:
+            meta = saved_meta["meta"]
+            self.offsets = saved_meta.get("offsets", {})
+            self.hashes = saved_meta["hashes"]
+            self.next_id = saved_meta["next_id"]
+        else:
+            # older pickles hold only str(position) -> filename
+            meta = saved_meta
+            self.offsets = {}
+            self.hashes = {}
+            self.next_id = len(meta)
+        if os.path.exists(self.config_path):
+            with open(self.config_path, "r") as f:
+                saved = json.load(f)
+            # configs saved before storage was configurable describe float32 (or PQ) vectors
+            storage = "pq" if saved["config"].get("index_type") == "ivf_pq" else "float32"
+            self.config = {**DEFAULT_CONFIG, "storage": storage, **saved["config"]}
+            self.report = saved.get("report")
+        else:
+            # indexes persisted before index types were configurable are flat
+            self.config = {**DEFAULT_CONFIG, "index_type": "flat", "storage": "float32"}
+        index = self._read_index()
         self.index = index
         self.meta = meta
+        self.doc_ids = self._group_ids(meta)
+        self.fingerprint = saved_meta.get("fingerprint") if "next_id" in saved_meta else None
+        if self.fingerprint is None and self.hashes:
+            self.fingerprint = corpus.fingerprint(self.hashes)
         return meta, None
 
-    def build(self, embeddings, meta):
-        # embeddings: numpy array (N, dim)
+    def _read_index(self):
+        self.mapped = self.mmap
+        return faiss.read_index(self.index_path, MMAP_FLAG if self.mmap else 0)
+
+    def _writable(self):
+        # a mapped index cannot be modified (FAISS aborts); load a private copy first
+        if self.mapped:
+            self.index = faiss.read_index(self.index_path)
+            self.mapped = False
+
+    @staticmethod
+    def _group_ids(meta):
+        doc_ids = {}
+        for k, filename in meta.items():
+            doc_ids.setdefault(filename, []).append(int(k))
+        return doc_ids
+
+    def _save(self):
+        self.fingerprint = corpus.fingerprint(self.hashes) if self.hashes else None
+        # write + rename: other processes may have the old file mapped
+        tmp_path = self.index_path + ".tmp"
+        faiss.write_index(self.index, tmp_path)
+        os.replace(tmp_path, self.index_path)
+        with open(self.meta_path, "wb") as f:
+            pickle.dump({
+                "meta": self.meta,
+                "offsets": self.offsets,
+                "hashes": self.hashes,
+                "next_id": self.next_id,
+                "fingerprint": self.fingerprint,
+            }, f)
+        with open(self.config_path, "w") as f:
+            json.dump({"config": self.config, "report": self.report}, f, indent=2)
+        if self.mmap:
+            # serve from the shared mapping instead of this process's private copy
+            self.index = self._read_index()
+
+    @property
+    def incremental(self) -> bool:
+        """True when the loaded index maps stable vector ids (legacy positional indexes must be rebuilt)."""
+        index = faiss.downcast_index(self.index)
+        if isinstance(index, faiss.IndexIDMap2):
+            # IVF removal reorders rows, which IndexIDMap2 cannot follow (FAISS aborts)
+            return not isinstance(faiss.downcast_index(index.index), faiss.IndexIVF)
+        # IVF indexes store ids natively; ones saved before stable ids hold positions
+        return isinstance(index, faiss.IndexIVF) and self.stable_ids
+
+    @staticmethod
+    def _normalize(embeddings):
         norms = np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-10
-        embeddings = embeddings / norms
-        dim = embeddings.shape[1]
-        index = faiss.IndexFlatL2(dim)
-        index.add(embeddings)
-        faiss.write_index(index, self.index_path)
+        return (embeddings / norms).astype("float32")
+
+    def build(self, embeddings, meta, config=None, hashes=None, offsets=None):
+        # embeddings: numpy array (N, dim); meta: position -> filename; offsets: chunk offset per row
+        embeddings = self._normalize(embeddings)
+        n, dim = embeddings.shape
+        base, config = make_index(dim, n, {**DEFAULT_CONFIG, **(config or {})})
+        if not base.is_trained:
+            base.train(embeddings)
+        # vector ids start out equal to positions, then stay fixed through upserts/deletes;
+        # IVF indexes take ids themselves, the others go through IndexIDMap2
+        index = base if isinstance(base, faiss.IndexIVF) else faiss.IndexIDMap2(base)
+        index.add_with_ids(embeddings, np.arange(n, dtype="int64"))
+        report = self._recall_report(index, embeddings, config)
+        if report["recall_at_k"] < config["min_recall"]:
+            raise ValueError(f"recall@{report['k']} {report['recall_at_k']:.3f} is below min_recall "
+                             f"{config['min_recall']} for {config['index_type']} / {config['storage']}")
         # normalize meta keys to str(index)->filename
         meta_map = {}
         for k, v in meta.items():
             meta_map[str(k)] = v
-        with open(self.meta_path, "wb") as f:
-            pickle.dump(meta_map, f)
-        self.index = index
-        self.meta = meta_map
+        with self._lock:
+            self.index = index
+            self.meta = meta_map
+            self.offsets = {str(i): int(o) for i, o in enumerate(offsets or []) if o}
+            self.chunked = offsets is not None
+            self.doc_ids = self._group_ids(meta_map)
+            self.hashes = dict(hashes or {})
+            self.next_id = n
+            self.stable_ids = True
+            self.config = config
+            self.report = report
+            self._save()
+        return report
+
+    def upsert(self, embeddings, filenames, hashes, offsets=None):
+        """
+        Replace every vector of the documents in `filenames` with the given
+        rows. filenames / hashes / offsets are aligned with the rows, so a
+        document split into chunks appears once per chunk.
+        """
+        if not self.incremental:
+            raise RebuildRequired("index was built without stable vector ids")
+        touched = list(dict.fromkeys(filenames))
+        existing = [f for f in touched if f in self.doc_ids]
+        if existing and self.config["index_type"] == "hnsw":
+            raise RebuildRequired("HNSW indexes cannot remove vectors")
+        embeddings = self._normalize(embeddings)
+        offsets = offsets or [0] * len(filenames)
+        with self._lock:
+            self._writable()
+            self._remove_docs(existing)
+            ids = np.arange(self.next_id, self.next_id + len(filenames), dtype="int64")
+            for vid, filename, file_hash, offset in zip(ids.tolist(), filenames, hashes, offsets):
+                self.meta[str(vid)] = filename
+                if offset:
+                    self.offsets[str(vid)] = int(offset)
+                self.doc_ids.setdefault(filename, []).append(vid)
+                self.hashes[filename] = file_hash
+            self.next_id += len(filenames)
+            self.index.add_with_ids(embeddings, ids)
+            self._save()
+        return {"updated": len(existing), "added": len(touched) - len(existing), "vectors": len(filenames)}
+
+    def _remove_docs(self, filenames):
+        ids = [vid for f in filenames for vid in self.doc_ids.pop(f, [])]
+        if ids:
+            self.index.remove_ids(np.array(ids, dtype="int64"))
+        for vid in ids:
+            self.meta.pop(str(vid), None)
+            self.offsets.pop(str(vid), None)
+        return ids
+
+    def delete(self, filenames):
+        if not self.incremental:
+            raise RebuildRequired("index was built without stable vector ids")
+        if self.config["index_type"] == "hnsw":
+            raise RebuildRequired("HNSW indexes cannot remove vectors")
+        with self._lock:
+            self._writable()
+            deleted = [f for f in filenames if f in self.doc_ids]
+            self._remove_docs(deleted)
+            for filename in filenames:
+                self.hashes.pop(filename, None)
+            self._save()
+        return {"deleted": len(deleted)}
+
+    @staticmethod
+    def _set_search_params(index, config, nprobe=None, ef_search=None):
+        index_type = config["index_type"]
+        if index_type in ("ivf_flat", "ivf_pq"):
+            faiss.extract_index_ivf(index).nprobe = int(nprobe or config["nprobe"])
+        elif index_type == "hnsw":
+            base = faiss.downcast_index(index)
+            if isinstance(base, faiss.IndexIDMap2):
+                base = faiss.downcast_index(base.index)
+            base.hnsw.efSearch = int(ef_search or config["ef_search"])
 
-    def search(self, query_emb, top_k):
+    def _recall_report(self, index, embeddings, config):
+        """recall@k of `index` against exact search, on a sample of the build set used as queries."""
+        n = embeddings.shape[0]
+        k = min(RECALL_K, n)
+        rng = np.random.default_rng(0)
+        queries = embeddings[rng.choice(n, size=min(RECALL_SAMPLE, n), replace=False)]
+
+        exact = faiss.IndexFlatL2(embeddings.shape[1])
+        exact.add(embeddings)
+        t0 = time.perf_counter()
+        _, exact_ids = exact.search(queries, k)
+        exact_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+
+        self._set_search_params(index, config)
+        t0 = time.perf_counter()
+        _, approx_ids = index.search(queries, k)
+        approx_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+
+        hits = sum(len(set(a) & set(e)) for a, e in zip(approx_ids.tolist(), exact_ids.tolist()))
+        # serialized size: vector codes plus ids, graph links and IVF lists, as held in memory
+        index_bytes = int(faiss.serialize_index(index).nbytes)
+        return {
+            "index_type": config["index_type"],
+            "storage": config["storage"],
+            "vectors": n,
+            "index_bytes": index_bytes,
+            "bytes_per_vector": index_bytes / n,
+            "float32_bytes_per_vector": embeddings.shape[1] * 4,
+            "queries": len(queries),
+            "k": k,
+            "recall_at_k": hits / (k * len(queries)),
+            "exact_ms_per_query": exact_ms,
+            "index_ms_per_query": approx_ms,
+        }
+
+    def search(self, query_emb, top_k, nprobe=None, ef_search=None):
+        distances, ids = self.search_batch(np.asarray(query_emb).reshape(1, -1), top_k, nprobe, ef_search)
+        return distances[0], ids[0]
+
+    def search_batch(self, query_embs, top_k, nprobe=None, ef_search=None):
+        """One index.search over an (N, dim) query matrix; returns (N, k) distance / id lists."""
         if self.index is None:
             raise ValueError("FAISS index is not loaded!")
-        q = query_emb / (np.linalg.norm(query_emb) + 1e-10)
-        q = q.reshape(1, -1)
-        distances, ids = self.index.search(q, top_k)
-        # distances shape (1, k), ids shape (1, k)
-        return distances[0].tolist(), ids[0].tolist()
+        q = np.asarray(query_embs, dtype="float32")
+        q = q / (np.linalg.norm(q, axis=1, keepdims=True) + 1e-10)
+        with self._lock:
+            self._set_search_params(self.index, self.config, nprobe, ef_search)
+            distances, ids = self.index.search(np.ascontiguousarray(q, dtype="float32"), top_k)
+        return distances.tolist(), ids.tolist()
+
+    def search_documents(self, query_emb, top_k, pooling="max", nprobe=None, ef_search=None):
+        """
+        Search chunk vectors and pool them back to documents.
+
+        pooling="max" ranks a document by its best chunk; "sum" ranks by the
+        summed cosine similarity of its retrieved chunks, favouring documents
+        that match in many places. Each hit reports the best chunk's L2
+        distance as `score`, the ranking value as `pooled`, and the best
+        chunk's id and character offset.
+        """
+        query = np.asarray(query_emb).reshape(1, -1)
+        return self.search_documents_batch(query, top_k, pooling, nprobe=nprobe, ef_search=ef_search)[0]
+
+    def search_documents_batch(self, query_embs, top_k, pooling="max", nprobe=None, ef_search=None):
+        """search_documents for every row of an (N, dim) matrix; returns N hit lists."""
+        if pooling not in POOLING:
+            raise ValueError(f"unknown pooling {pooling!r}, expected one of {POOLING}")
+        query_embs = np.asarray(query_embs, dtype="float32")
+        results = [None] * query_embs.shape[0]
+        pending = list(range(query_embs.shape[0]))
+        ntotal = self.index.ntotal
+        fetch = top_k * CHUNK_OVERFETCH
+        while pending:
+            # only queries whose pooled results are still short of top_k documents fetch deeper
+            distances, ids = self.search_batch(query_embs[pending], min(fetch, ntotal), nprobe=nprobe, ef_search=ef_search)
+            short = []
+            for row, d, i in zip(pending, distances, ids):
+                hits = self._pool(d, i, pooling)
+                if len(hits) >= top_k or fetch >= ntotal:
+                    results[row] = hits[:top_k]
+                else:
+                    short.append(row)
+            pending = short
+            fetch *= 2
+        return results
+
+    def _pool(self, distances, ids, pooling):
+        docs = {}  # filename -> hit
+        for dist, vid in zip(distances, ids):
+            filename = self.meta.get(str(vid)) if vid >= 0 else None
+            if filename is None:
+                continue
+            sim = 1.0 - dist / 2.0  # cosine similarity of unit vectors
+            hit = docs.get(filename)
+            if hit is None:
+                docs[filename] = {"filename": filename, "score": dist, "pooled": sim, "id": vid,
+                                  "offset": self.offsets.get(str(vid), 0)}
+            else:
+                hit["pooled"] += sim
+        hits = list(docs.values())
+        if pooling == "max":
+            # results arrive sorted by distance, so the first chunk seen per document is its best
+            for hit in hits:
+                hit["pooled"] = 1.0 - hit["score"] / 2.0
+        hits.sort(key=lambda h: -h["pooled"])
+        return hits
@@ -232,29 +232,112 @@ with sc2:
         submit_btn = st.button("Sparkle Search", type="primary", use_container_width=True)
 
 # =======================
-# SEARCH HANDLER
+# RESULT CARD
 # =======================
-if (submit_btn or query) and query.strip():
-
-    # Gemini-style spinner
-    with st.spinner(" Analyzing semantics..."):
+def render_result(item, explanation=None):
+    """Draw one result card; explanation=None renders the card before its explanation arrives."""
+    filename = item["filename"]
+    score = item["score"]
+    pending = explanation is None
+    explanation = explanation or {}
+    preview = item["preview"]
+    full_text = item["full_text"]
+
+    safe_preview = html.escape(preview)
+    
+    # Prepare keyword HTML
+    keywords = explanation.get("keyword_overlap", [])
+    keyword_html = ""
+    if keywords:
+        keyword_html = "".join([f"<span class='keyword-pill'>{kw}</span>" for kw in keywords])
+    
+    # Doc Icon (SVG) - Changed stroke to dark blue for visibility on light bg
+    doc_icon = """<svg width="20" height="20" viewBox="0 0 24 24" fill="none" stroke="#0b57d0" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M14.5 2H6a2 2 0 0 0-2 2v16a2 2 0 0 0 2 2h12a2 2 0 0 0 2-2V7.5L14.5 2z"></path><polyline points="14 2 14 8 20 8"></polyline></svg>"""
+
+    # Main Card Render
+    st.markdown(f"""
+    <div class="result-card">
+        <div style="display:flex; justify-content:space-between; align-items:start;">
+            <div class="card-title">
+                {doc_icon} {filename}
+            </div>
+            <div class="score-badge">match: {score:.4f}</div>
+        </div>
+        <p class="card-preview">{safe_preview}...</p>
+        <div style="margin-top: 10px;">
+            <div style="font-weight:600; color:#1f1f1f; margin-bottom:6px;">
+               Keyword Overlap:
+            </div>
+            {keyword_html}
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
 
-        response = requests.post(
-            f"{API_GATEWAY_URL}/search",
-            json={"query": query, "top_k": top_k}
-        )
+    if pending:
+        st.caption("Generating explanation...")
+        return
 
+    # Details Expander (Standard Streamlit but styled via global CSS)
+    with st.expander(f"View Document Insights: Semantic Overlap, Top Sentences, LLM Reasoning & Full Text for {filename}"):
+        
+        overlap_ratio = explanation.get("overlap_ratio", 0)
+        sentences = explanation.get("top_sentences", [])
+        
+        st.caption(f"Semantic Overlap Ratio: {overlap_ratio:.3f}")
+        
+        if sentences:
+            st.markdown("**Key Excerpts:**")
+            for s in sentences:
+                # Updated quote box for light mode
+                st.markdown(f"""
+                <div style="background: #ffffff; border-left: 3px solid #4285f4; padding: 10px; margin-bottom: 5px; border-radius: 0 8px 8px 0; box-shadow: 0 1px 3px rgba(0,0,0,0.05);">
+                    <span style="color: #1f1f1f;">"{s['sentence']}"</span> 
+                    <span style="color: #5e5e5e; font-size: 0.8em; margin-left: 10px;">(conf: {s['score']:.2f})</span>
+                </div>
+                """, unsafe_allow_html=True)
+        llm_expl = explanation.get("llm_explanation")
+        if llm_expl:
+             st.markdown("**Why this document?**")
+             st.write(llm_expl)
+        st.markdown("---")
+        st.markdown("**📄 Full Document Content:**")
+        st.code(full_text, language="text") # Using code block for better readability of raw text
+
+
+def stream_search(query, top_k):
+    """Yield NDJSON events from the gateway's /search_stream endpoint."""
+    with requests.post(
+        f"{API_GATEWAY_URL}/search_stream",
+        json={"query": query, "top_k": top_k},
+        stream=True,
+    ) as response:
         if response.status_code != 200:
-            st.error(f"❌ Connection Error: {response.text}")
-            st.stop()
+            yield {"type": "error", "error": "connection_error", "detail": response.text}
+            return
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+
+
+# =======================
+# SEARCH HANDLER
+# =======================
+if (submit_btn or query) and query.strip():
 
+    events = stream_search(query, top_k)
+
+    # Gemini-style spinner, only until the ranked hits arrive
+    with st.spinner(" Analyzing semantics..."):
         try:
-            data = response.json()
-        except:
-            st.error("❌ Invalid JSON response.")
-            st.stop()
+            first = next(events, {"type": "error", "detail": "empty response"})
+        except (requests.RequestException, ValueError) as e:
+            first = {"type": "error", "error": "connection_error", "detail": str(e)}
+
+    if first.get("error") == "connection_error":
+        st.error(f"❌ Connection Error: {first['detail']}")
+        st.stop()
 
-    if "results" not in data:
+    if first["type"] != "hits" or not first["results"]:
         st.info("No relevant documents found for that query.")
         st.stop()
 
@@ -264,69 +347,23 @@ if (submit_btn or query) and query.strip():
 
     # =======================
     # DISPLAY RESULTS (Card Style)
+    # cards render immediately; each one is redrawn when its explanation streams in
     # =======================
-    for item in data["results"]:
-        filename = item["filename"]
-        score = item["score"]
-        explanation = item["explanation"]
-        preview = item["preview"]
-        full_text = item["full_text"]
-
-        safe_preview = html.escape(preview)
-        
-        # Prepare keyword HTML
-        keywords = explanation.get("keyword_overlap", [])
-        keyword_html = ""
-        if keywords:
-            keyword_html = "".join([f"<span class='keyword-pill'>{kw}</span>" for kw in keywords])
-        
-        # Doc Icon (SVG) - Changed stroke to dark blue for visibility on light bg
-        doc_icon = """<svg width="20" height="20" viewBox="0 0 24 24" fill="none" stroke="#0b57d0" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M14.5 2H6a2 2 0 0 0-2 2v16a2 2 0 0 0 2 2h12a2 2 0 0 0 2-2V7.5L14.5 2z"></path><polyline points="14 2 14 8 20 8"></polyline></svg>"""
-
-        # Main Card Render
-        st.markdown(f"""
-        <div class="result-card">
-            <div style="display:flex; justify-content:space-between; align-items:start;">
-                <div class="card-title">
-                    {doc_icon} {filename}
-                </div>
-                <div class="score-badge">match: {score:.4f}</div>
-            </div>
-            <p class="card-preview">{safe_preview}...</p>
-            <div style="margin-top: 10px;">
-                <div style="font-weight:600; color:#1f1f1f; margin-bottom:6px;">
-                   Keyword Overlap:
-                </div>
-                {keyword_html}
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
-
-        # Details Expander (Standard Streamlit but styled via global CSS)
-        with st.expander(f"View Document Insights: Semantic Overlap, Top Sentences, LLM Reasoning & Full Text for {filename}"):
-            
-            overlap_ratio = explanation.get("overlap_ratio", 0)
-            sentences = explanation.get("top_sentences", [])
-            
-            st.caption(f"Semantic Overlap Ratio: {overlap_ratio:.3f}")
-            
-            if sentences:
-                st.markdown("**Key Excerpts:**")
-                for s in sentences:
-                    # Updated quote box for light mode
-                    st.markdown(f"""
-                    <div style="background: #ffffff; border-left: 3px solid #4285f4; padding: 10px; margin-bottom: 5px; border-radius: 0 8px 8px 0; box-shadow: 0 1px 3px rgba(0,0,0,0.05);">
-                        <span style="color: #1f1f1f;">"{s['sentence']}"</span> 
-                        <span style="color: #5e5e5e; font-size: 0.8em; margin-left: 10px;">(conf: {s['score']:.2f})</span>
-                    </div>
-                    """, unsafe_allow_html=True)
-            llm_expl = explanation.get("llm_explanation")
-            if llm_expl:
-                 st.markdown("**Why this document?**")
-                 st.write(llm_expl)
-            st.markdown("---")
-            st.markdown("**📄 Full Document Content:**")
-            st.code(full_text, language="text") # Using code block for better readability of raw text
+    items = first["results"]
+    slots = []
+    for item in items:
+        slot = st.empty()
+        with slot.container():
+            render_result(item)
+        slots.append(slot)
+
+    for event in events:
+        if event["type"] != "explanation":
+            continue
+        rank = event["rank"]
+        with slots[rank].container():
+            render_result(items[rank], event["explanation"])
+
 if run_eval:
 
     st.info("Running evaluation... this may take 10–20 seconds...")
@@ -3,19 +3,39 @@ echo "🚀 Starting multi-service system..."
 
 export PYTHONPATH="/app"
 
-# DOC SERVICE
-uvicorn src.doc_service.app:app --host 0.0.0.0 --port 9001 &
-# EMBED SERVICE
-uvicorn src.embed_service.app:app --host 0.0.0.0 --port 9002 &
-# SEARCH SERVICE
-uvicorn src.search_service.app:app --host 0.0.0.0 --port 9003 &
-# EXPLAIN SERVICE
-uvicorn src.explain_service.app:app --host 0.0.0.0 --port 9004 &
-# API GATEWAY
-uvicorn src.api_gateway.app:app --host 0.0.0.0 --port 8000 &
-
-# Wait for all services to boot
-sleep 8
+# services (default): five processes talking HTTP
+# monolith: one process, the gateway runs doc/embed/search/explain in-process with one shared model
+export DEPLOY_MODE="${DEPLOY_MODE:-services}"
+
+if [ "$DEPLOY_MODE" = "monolith" ]; then
+  # API GATEWAY (+ all components)
+  uvicorn src.api_gateway.app:app --host 0.0.0.0 --port 8000 &
+else
+  # DOC SERVICE
+  uvicorn src.doc_service.app:app --host 0.0.0.0 --port 9001 &
+  # EMBED SERVICE
+  uvicorn src.embed_service.app:app --host 0.0.0.0 --port 9002 &
+  # SEARCH SERVICE
+  uvicorn src.search_service.app:app --host 0.0.0.0 --port 9003 &
+  # EXPLAIN SERVICE
+  uvicorn src.explain_service.app:app --host 0.0.0.0 --port 9004 &
+  # API GATEWAY
+  uvicorn src.api_gateway.app:app --host 0.0.0.0 --port 8000 &
+fi
+
+# Wait for all services to boot: the gateway's /ready answers 200 once every service does
+READY_TIMEOUT=${READY_TIMEOUT:-120}
+waited=0
+until curl -sf -o /dev/null http://localhost:8000/ready; do
+  if [ $waited -ge $((READY_TIMEOUT * 2)) ]; then
+    echo "❌ Services not ready after ${READY_TIMEOUT}s:"
+    curl -s http://localhost:8000/ready
+    echo
+    exit 1
+  fi
+  sleep 0.5
+  waited=$((waited+1))
+done
 echo "✅ All microservices running!"
 
 # --------------------------
@@ -0,0 +1,110 @@
+# tests/test_cache_manager.py
+import json
+
+import numpy as np
+import pytest
+
+from src.embed_service.cache_manager import CacheManager
+from src.embed_service.vector_store import MmapVectorStore
+
+
+def _vectors(n, dim=8, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype("float32")
+
+
+def test_add_release_compact_reopen(tmp_path):
+    vectors = _vectors(4)
+    cache = CacheManager(str(tmp_path))
+    cache.add_embeddings(["a", "b", "c"], ["h1", "h2", "h3"], vectors[:3])
+    # same content under a new name is linked, not stored again
+    cache.add_embeddings(["d"], ["h1"], vectors[3:])
+    assert cache.stats()["rows"] == 3
+    assert cache.refs["h1"] == 2
+
+    assert cache.release(["b"], prefixes=["c"]) == 2
+    assert cache.stats()["garbage_rows"] == 2
+
+    # reopened from the journal alone: the release was never checkpointed
+    reopened = CacheManager(str(tmp_path))
+    assert reopened.files == {"a": "h1", "d": "h1"}
+    assert reopened.stats()["garbage_rows"] == 2
+
+    assert reopened.compact() == 2
+    assert len(reopened.store) == 1
+    reopened.add_embeddings(["e"], ["h5"], vectors[1:2])
+
+    final = CacheManager(str(tmp_path))
+    assert final.rows == {"h1": 0, "h5": 1}
+    np.testing.assert_allclose(final.get_embedding("d"), vectors[0])
+    np.testing.assert_allclose(final.get_embedding("e"), vectors[1])
+    assert sorted(p.name for p in tmp_path.glob("embeddings*.npy")) == ["embeddings.1.npy"]
+
+
+def test_compaction_interrupted_after_commit_point(tmp_path, monkeypatch):
+    vectors = _vectors(3)
+    cache = CacheManager(str(tmp_path))
+    cache.add_embeddings(["a", "b", "c"], ["h1", "h2", "h3"], vectors)
+    cache.release(["a"])
+
+    def crash(self, path, count):
+        raise SystemExit("killed")
+
+    monkeypatch.setattr(MmapVectorStore, "switch", crash)
+    with pytest.raises(SystemExit):
+        cache.compact()
+    monkeypatch.undo()
+
+    reopened = CacheManager(str(tmp_path))
+    assert reopened.rows == {"h2": 0, "h3": 1}
+    np.testing.assert_allclose(reopened.get_embedding("c"), vectors[2])
+    assert sorted(p.name for p in tmp_path.glob("embeddings*.npy")) == ["embeddings.1.npy"]
+
+
+def test_torn_journal_line_is_dropped(tmp_path):
+    vectors = _vectors(2)
+    cache = CacheManager(str(tmp_path))
+    cache.add_embeddings(["a"], ["h1"], vectors[:1])
+    with open(tmp_path / "embed_journal.jsonl", "a") as f:
+        f.write('{"count": 2, "rows": {"h2"')
+
+    reopened = CacheManager(str(tmp_path))
+    assert reopened.files == {"a": "h1"}
+    reopened.add_embeddings(["b"], ["h2"], vectors[1:])
+    assert CacheManager(str(tmp_path)).files == {"a": "h1", "b": "h2"}
+
+
+def test_opens_v1_cache(tmp_path):
+    # filename -> {"hash", "index"} meta next to an np.save'd matrix with no store header
+    vectors = _vectors(3)
+    np.save(tmp_path / "embeddings.npy", vectors)
+    with open(tmp_path / "embed_meta.json", "w") as f:
+        json.dump({
+            "a": {"hash": "h1", "index": 0},
+            "b": {"hash": "h2", "index": 1},
+            "c": {"hash": "h1", "index": 2},
+        }, f)
+
+    cache = CacheManager(str(tmp_path))
+    assert cache.files == {"a": "h1", "b": "h2", "c": "h1"}
+    assert cache.refs == {"h1": 2, "h2": 1}
+    np.testing.assert_allclose(cache.get_embedding("c"), vectors[0])
+    assert cache.stats()["garbage_rows"] == 1
+    with open(tmp_path / "embed_meta.json") as f:
+        assert json.load(f)["version"] == 2
+
+    assert cache.compact() == 1
+    reopened = CacheManager(str(tmp_path))
+    np.testing.assert_allclose(reopened.get_embedding("b"), vectors[1])
+
+
+def test_vector_store_grows_in_place(tmp_path):
+    vectors = _vectors(11)
+    store = MmapVectorStore(str(tmp_path / "v.npy"), str(tmp_path / "v.json"), dim=8, initial_capacity=4)
+    assert store.append(vectors[:3]) == 0
+    assert store.append(vectors[3:]) == 3
+    assert store.capacity == 16
+    store.flush()
+
+    reopened = MmapVectorStore(str(tmp_path / "v.npy"), str(tmp_path / "v.json"))
+    assert len(reopened) == 11
+    np.testing.assert_allclose(reopened.view(), vectors)
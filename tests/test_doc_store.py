@@ -0,0 +1,50 @@
+# tests/test_doc_store.py
+import os
+
+import pytest
+
+from src.doc_service.store import DocStore
+from src.doc_service.utils import DocManifest, scan_documents
+
+
+def _scan(store, folder, manifest):
+    with store.scan() as removed:
+        for seq, (doc, _) in enumerate(scan_documents(str(folder), manifest, workers=1)):
+            store.put(doc, seq)
+    return removed[0]
+
+
+def test_rescan_with_modified_and_deleted_files(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    for name, text in [("a.txt", "alpha one"), ("b.txt", "beta two"), ("c.txt", "gamma three")]:
+        (data / name).write_text(text)
+    manifest = DocManifest(str(tmp_path / "manifest.json"))
+    store = DocStore(str(tmp_path / "docs.sqlite3"))
+    assert _scan(store, data, manifest) == 0
+    before = store.hashes()
+
+    (data / "b.txt").write_text("beta two, rewritten")
+    os.utime(data / "b.txt", ns=(1, 1))
+    (data / "c.txt").unlink()
+
+    # readers keep the last committed scan while the next one is written; a failed scan rolls back
+    with pytest.raises(RuntimeError):
+        with store.scan():
+            store.put({"filename": "z.txt", "path": str(data / "z.txt"), "hash": "h", "length": 0}, 0)
+            assert store.filenames() == ["a.txt", "b.txt", "c.txt"]
+            raise RuntimeError("scan failed")
+    assert store.filenames() == ["a.txt", "b.txt", "c.txt"]
+
+    # a fresh process: the store is reopened and only b.txt is read again
+    store = DocStore(str(tmp_path / "docs.sqlite3"))
+    assert _scan(store, data, manifest) == 1
+    assert store.filenames() == ["a.txt", "b.txt"]
+    assert store.hashes()["a.txt"] == before["a.txt"]
+    assert store.hashes()["b.txt"] != before["b.txt"]
+
+    doc = store.get("b.txt")
+    assert doc["clean_text"] == "beta two, rewritten"
+    assert "path" not in doc
+    assert store.get("c.txt") is None
+    assert store.text_range("a.txt", 0, 5) == "alpha"
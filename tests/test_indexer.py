@@ -0,0 +1,44 @@
+# tests/test_indexer.py
+import numpy as np
+import pytest
+
+from src.search_service.indexer import INDEX_TYPES, FAISSIndexer, RebuildRequired
+
+
+def _indexer(tmp_path):
+    indexer = FAISSIndexer()
+    indexer.index_path = str(tmp_path / "faiss_index.bin")
+    indexer.meta_path = str(tmp_path / "faiss_meta.pkl")
+    indexer.config_path = str(tmp_path / "faiss_config.json")
+    return indexer
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_delete_and_upsert_every_index_type(tmp_path, index_type):
+    rng = np.random.default_rng(0)
+    n, dim = 2000, 32
+    embeddings = rng.standard_normal((n, dim)).astype("float32")
+    meta = {i: f"f{i // 4}.txt" for i in range(n)}
+    hashes = {f"f{i}.txt": "h" for i in range(n // 4)}
+    indexer = _indexer(tmp_path)
+    indexer.build(embeddings, meta, {"index_type": index_type, "pq_m": 8}, hashes=hashes, offsets=[0] * n)
+
+    if index_type == "hnsw":
+        with pytest.raises(RebuildRequired):
+            indexer.delete(["f1.txt"])
+        return
+
+    assert indexer.delete(["f1.txt"]) == {"deleted": 1}
+    assert indexer.index.ntotal == n - 4
+    fresh = rng.standard_normal((2, dim)).astype("float32")
+    indexer.upsert(fresh, ["f2.txt", "f2.txt"], ["h2", "h2"], [0, 10])
+    assert indexer.index.ntotal == n - 4 - 2
+    hits = indexer.search_documents(fresh[0], 3, nprobe=100)
+    assert "f1.txt" not in [h["filename"] for h in hits]
+    assert hits[0]["filename"] == "f2.txt"
+
+    reloaded = _indexer(tmp_path)
+    reloaded.try_load()
+    assert reloaded.incremental
+    reloaded.delete(["f3.txt"])
+    assert reloaded.index.ntotal == n - 10